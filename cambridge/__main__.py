@@ -1,8 +1,7 @@
 import argparse
 import logging
 
-import control
-import crawl
+import db
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +15,18 @@ logging.basicConfig(
 
 parser = argparse.ArgumentParser(description='Cambridge commands')
 parser.add_argument('action', metavar='<action>',
-                    choices=['crawl', 'parse', 'collect', 'generate', 'debug'])
+                    choices=['crawl', 'parse', 'collect', 'inflection',
+                             'generate', 'debug', 'compress', 'export-corpus',
+                             'export-lookup', 'lookup', 'search',
+                             'export-snapshot', 'import-snapshot',
+                             'benchmark'])
 parser.add_argument('dictname', metavar='<dictname>')
 parser.add_argument('--option', metavar='<option>', default=None)
+parser.add_argument('--workers', metavar='<workers>', type=int, default=1)
+parser.add_argument('--incremental', action='store_true')
+parser.add_argument('--corpus', metavar='<corpus>', default=None)
+parser.add_argument('--storage', metavar='<storage>', default='mongo',
+                    choices=['mongo', 'sqlite'])
 
 args = parser.parse_args()
 
@@ -26,22 +34,46 @@ if __name__ == "__main__":
     action = args.action
     dictname = args.dictname
     option = args.option
+    workers = args.workers
+    incremental = args.incremental
 
-    # Crawl html and store to html collection
+    # Storage backend, connected on first use
+    db.backend = args.storage
+
+    # Get html from corpus file instead of html collection
+    if args.corpus is not None and action != 'export-corpus':
+        db.use_corpus(args.corpus)
+
+    # Only import modules of action, crawl imports scrapy
+    if action == 'crawl':
+        import crawl
+    elif action == 'benchmark':
+        import benchmark
+    else:
+        import control
+
+    # Crawl html and store to html collection, conditional requests of
+    # crawled pages with option refresh
     if action == 'crawl':
-        crawl.crawl_html(dictname)
+        crawl.crawl_html(dictname, option == 'refresh')
 
-    # Parse html to json and store to data collection
+    # Parse html to json and store to data collection, only pages changed
+    # by refresh crawl of option changed
     elif action == 'parse':
-        control.parse_html(dictname)
+        control.parse_html(dictname, workers, incremental,
+                           option == 'changed')
 
     # Collect list of word from data collection
     elif action == 'collect':
-        control.collect_words(dictname)
+        control.collect_words(dictname, workers)
 
-    # Generate .mobi file
+    # Build inflection index of titles in data collection
+    elif action == 'inflection':
+        control.build_inflection(dictname, workers)
+
+    # Generate .mobi file, or StarDict, dictd files of option
     elif action == 'generate':
-        control.generate_book(dictname)
+        control.generate_book(dictname, workers, incremental, option)
 
     # Debug get sample data for analyze
     elif action == 'debug':
@@ -51,5 +83,48 @@ if __name__ == "__main__":
             control.debug_check_layout(dictname)
         elif option == 'export':
             control.debug_export_info(dictname)
+        elif option == 'explain':
+            control.debug_explain(dictname)
         else:
             control.debug_check_word(dictname, option)
+
+    # Strip and compress html collection
+    elif action == 'compress':
+        control.compress_html(dictname)
+
+    # Export html collection to corpus file
+    elif action == 'export-corpus':
+        control.export_corpus(dictname, args.corpus)
+
+    # Build lookup file from data collection
+    elif action == 'export-lookup':
+        control.build_lookup(dictname)
+
+    # Look up word or inflection in lookup file, no database is used
+    elif action == 'lookup':
+        control.lookup_word(dictname, option)
+
+    # Autocomplete and suggest words of titles and inflections
+    elif action == 'search':
+        control.search_word(dictname, option)
+
+    # Export collections to compressed JSON Lines files, all or of option
+    elif action == 'export-snapshot':
+        control.export_snapshot(dictname, option)
+
+    # Import collections from compressed JSON Lines files
+    elif action == 'import-snapshot':
+        control.import_snapshot(dictname, option, workers)
+
+    # Benchmark
+    elif action == 'benchmark':
+        if option == 'block':
+            benchmark.benchmark_block(dictname)
+        elif option == 'storage':
+            benchmark.benchmark_storage(dictname)
+        elif option == 'render':
+            benchmark.benchmark_render(dictname)
+        elif option == 'search':
+            benchmark.benchmark_search(dictname)
+        elif option == 'startup':
+            benchmark.benchmark_startup()
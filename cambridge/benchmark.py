@@ -0,0 +1,312 @@
+import logging
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import lxml.html
+
+import db
+import generate
+from inflection import load_index
+from search import SearchIndex
+from storage import BACKENDS, create_storage
+from word import get_layout, get_outermost
+
+logger = logging.getLogger(__name__)
+
+DIR = Path(__file__).parent
+
+# Module of action: (import time budget in ms, modules must not be imported)
+STARTUP = {
+    'control': (500, ['scrapy', 'twisted', 'pymongo', 'lemminflect']),
+    'benchmark': (500, ['scrapy', 'twisted', 'pymongo', 'lemminflect']),
+    'crawl': (5000, ['pymongo', 'lemminflect'])
+}
+
+
+def __timeit(func, *args, repeat=5):
+    '''Get result and average seconds of function call.'''
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    seconds = (time.perf_counter() - start) / repeat
+
+    return result, seconds
+
+
+def __get_outermost_quadratic(tree, lst_blk):
+    '''Previous nesting check of Word, kept as reference.'''
+    def is_valid(block, lst):
+        valid = True
+        if block is tree:
+            valid = False
+        else:
+            for blk in lst:
+                if block is blk:
+                    continue
+                elif block in blk.iter():
+                    valid = False
+                    break
+
+        return valid
+
+    return [b for b in lst_blk if is_valid(b, lst_blk)]
+
+
+def benchmark_block(dictname, top=10):
+    """Benchmark outermost block filter on sample pages.
+
+    Every selector of layout is run on every sample page, the result of
+    both filters must be the same. Timing is reported for the heaviest
+    cases.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        top (int, optional): number of heaviest cases. Defaults to 10.
+    """
+    layout = get_layout()
+
+    lst_case = []
+    for doc in db.html_get_sample(dictname):
+        url = doc.get('url')
+        root = lxml.html.fromstring(doc.get('html'))
+
+        for cat in layout.cats:
+            for keyword, slt in layout.css[cat].items():
+                lst_slt = slt if isinstance(slt, list) else [slt]
+
+                lst_blk = []
+                [lst_blk.extend(s(root)) for s in lst_slt]
+
+                old = __get_outermost_quadratic(root, lst_blk)
+                new = get_outermost(root, lst_blk)
+                if old != new:
+                    raise AssertionError('{0} {1}'.format(url, keyword))
+
+                lst_case.append((len(lst_blk), url, keyword, root, lst_blk))
+
+    logger.info('%s cases have same result', len(lst_case))
+
+    lst_case.sort(key=lambda x: x[0], reverse=True)
+    for size, url, keyword, root, lst_blk in lst_case[:top]:
+        _, t_old = __timeit(__get_outermost_quadratic, root, lst_blk)
+        _, t_new = __timeit(get_outermost, root, lst_blk)
+
+        logger.info('%s %s blocks=%s old=%.6fs new=%.6fs x%.1f',
+                    url.split('/')[-1], keyword, size, t_old, t_new,
+                    t_old / max(t_new, 1e-9))
+
+
+def __get_benchmark_storage(backend, dirpath):
+    '''Create empty storage of backend to benchmark.'''
+    if backend == 'mongo':
+        storage = create_storage(backend, dbname='cambridge_benchmark')
+    else:
+        filepath = Path(dirpath).joinpath('benchmark.sqlite')
+        storage = create_storage(backend, filepath=filepath)
+
+    storage.drop()
+    return storage
+
+
+def benchmark_storage(dictname, count=20000, size=db.BULK_SIZE):
+    """Benchmark write and read data of backends.
+
+    Data blocks are copied from current storage to an empty storage of
+    each backend, which is dropped after.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        count (int, optional): number of data blocks. Defaults to 20000.
+        size (int, optional): blocks per write. Defaults to BULK_SIZE.
+    """
+    lst_block = []
+    for doc in db.data_find(dictname):
+        doc.pop('_id', None)
+        lst_block.append(doc)
+        if len(lst_block) >= count:
+            break
+
+    lst_title = sorted(set(b.get('title') for b in lst_block))
+    logger.info('%s blocks, %s titles', len(lst_block), len(lst_title))
+
+    with tempfile.TemporaryDirectory() as dirpath:
+        for backend in BACKENDS:
+            storage = __get_benchmark_storage(backend, dirpath)
+
+            start = time.perf_counter()
+            for i in range(0, len(lst_block), size):
+                storage.data_write([], lst_block[i:i + size])
+            t_write = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for title in lst_title:
+                list(storage.data_find(dictname, [title]))
+            t_read = time.perf_counter() - start
+
+            start = time.perf_counter()
+            list(storage.data_find(dictname))
+            t_scan = time.perf_counter() - start
+
+            logger.info('%s write=%.3fs (%.0f/s) read=%.3fs (%.0f/s) '
+                        'scan=%.3fs', backend,
+                        t_write, len(lst_block) / max(t_write, 1e-9),
+                        t_read, len(lst_title) / max(t_read, 1e-9), t_scan)
+
+            storage.drop()
+            storage.close()
+
+
+def __generate_entry_format(data):
+    '''Previous entry rendering of generate, kept as reference.'''
+    entry = '''
+        <idx:entry name="english" scriptable="yes" spell="yes">
+            <idx:orth value="{title}"><b>{title}</b>
+                <idx:infl>{lst_iform}</idx:infl>
+            </idx:orth>
+            {dash_br} {ipa} {dash} {pos}
+            {definition}
+        </idx:entry>
+        <mbp:pagebreak />
+    '''
+    str_iform = '<idx:iform value="{form}" />'
+
+    lst_iform = ''
+    for form in data.get('lst_inf', []):
+        iform = str_iform
+        iform = iform.format(form=form)
+
+        lst_iform += iform
+
+    data.update({'lst_iform': lst_iform})
+    entry = entry.format(**data)
+
+    return entry
+
+
+def benchmark_render(dictname, count=20000):
+    """Benchmark entry rendering of generate against previous one.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        count (int, optional): number of data blocks. Defaults to 20000.
+    """
+    lst_block = []
+    for doc in db.data_find(dictname):
+        title = doc.get('title')
+        doc.update({
+            'pos': doc.get('pos', [None])[0],
+            'ipa': None,
+            'lst_inf': generate.get_all_inflection(title)
+        })
+
+        try:
+            lst_block.append(generate.__get_block_entry(doc))
+        except generate.ErrorEmptyDefinition:
+            continue
+
+        if len(lst_block) >= count:
+            break
+
+    for name, func in [('old', __generate_entry_format),
+                       ('new', generate.__generate_entry)]:
+        start = time.perf_counter()
+        size = sum(len(func(dict(b)).encode('utf-8')) for b in lst_block)
+        seconds = time.perf_counter() - start
+
+        logger.info('%s %s entries in %.3fs (%.0f/s), %s bytes', name,
+                    len(lst_block), seconds,
+                    len(lst_block) / max(seconds, 1e-9), size)
+
+
+def benchmark_search(dictname, count=200):
+    """Benchmark build, memory and queries of search index of titles.
+
+    Prefix queries use first letters of sample titles, fuzzy queries use
+    sample titles with one letter replaced.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        count (int, optional): number of queries. Defaults to 200.
+    """
+    info = db.info_get_doc(dictname, 'word')
+    lst_title = [t for t in info.get('titles', []) if t]
+    inf_index = load_index(dictname)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = SearchIndex(lst_title, inf_index)
+    t_build = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    logger.info('%s titles, %s keys: build %.3fs, %.1f MB', len(lst_title),
+                len(index), t_build, size / 1024 / 1024)
+
+    rnd = random.Random(0)
+    lst_sample = rnd.sample(lst_title, min(count, len(lst_title)))
+
+    lst_prefix = [t[:3] for t in lst_sample]
+    lst_fuzzy = []
+    for title in lst_sample:
+        i = rnd.randrange(len(title))
+        lst_fuzzy.append(title[:i] + 'x' + title[i + 1:])
+
+    for name, func, lst in [('prefix', index.prefix, lst_prefix),
+                            ('fuzzy', index.fuzzy, lst_fuzzy)]:
+        lst_time = []
+        for query in lst:
+            start = time.perf_counter()
+            func(query)
+            lst_time.append(time.perf_counter() - start)
+
+        lst_time.sort()
+        logger.info('%s %s queries: median %.3fms, p99 %.3fms', name,
+                    len(lst_time), lst_time[len(lst_time) // 2] * 1000,
+                    lst_time[int(len(lst_time) * 0.99)] * 1000)
+
+
+def benchmark_startup(dictname=None):
+    '''Check import time and imported modules of module of each action.'''
+    lst_fail = []
+    for module, (budget, lst_forbid) in STARTUP.items():
+        code = 'import sys; sys.path.insert(0, {0!r}); import {1}'
+        code = code.format(str(DIR), module)
+        args = [sys.executable, '-X', 'importtime', '-c', code]
+        proc = subprocess.run(args, capture_output=True, text=True)
+
+        total = 0
+        set_name = set()
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+
+            cols = line[len('import time:'):].split('|')
+            if not cols[0].strip().isdigit():
+                continue
+
+            total += int(cols[0])
+            set_name.add(cols[2].strip().split('.')[0])
+
+        total = total / 1000
+        lst_found = [m for m in lst_forbid if m in set_name]
+
+        logger.info('%s %.1fms (budget %sms) %s modules', module, total,
+                    budget, len(set_name))
+
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1:]
+            lst_fail.append('{0} import failed {1}'.format(module, error))
+        if total > budget:
+            lst_fail.append('{0} {1:.1f}ms > {2}ms'.format(module, total,
+                                                           budget))
+        if lst_found:
+            lst_fail.append('{0} imports {1}'.format(module,
+                                                     ', '.join(lst_found)))
+
+    if lst_fail:
+        raise AssertionError('; '.join(lst_fail))
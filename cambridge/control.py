@@ -1,18 +1,35 @@
+import itertools
 import json
 import logging
+import multiprocessing
+import time
 from pathlib import Path
 
 import lxml.html
 
 import db
 import generate
+from corpus import write_corpus
 from generate import get_all_inflection
-from word import ErrorUndefinedWord, Word
+from inflection import (InflectionIndex, get_index_path, load_index,
+                        write_index)
+from lookup import get_lookup_path, load_lookup, write_lookup
+from recrawl import get_html_hash
+from search import SearchIndex
+from snapshot import (COLLECTIONS, get_batches, get_snapshot_path,
+                      read_snapshot, write_snapshot)
+from word import ErrorUndefinedWord, Word, get_layout, strip_tree
 
 logger = logging.getLogger(__name__)
 
 DIR = Path(__file__).parent
 
+PARSE_CHUNK = 200  # Number of html documents per parse task
+INFLECT_CHUNK = 1000  # Number of titles per inflection task
+SNAPSHOT_CHUNK = 100  # Number of html documents per import write
+
+__state = None  # Parse state of worker process in incremental mode
+
 
 def __get_attr(element):
     """Get attributes of lxml.html element.
@@ -104,7 +121,6 @@ def debug_collect_sample(dictname):
         dictname (str): dictionary name eg. english, english-vietnamese
     """
     lst_doc = db.html_get_all(dictname)
-    clt_info = db.clt_info
 
     lst_leaf = []
     lst_attr = []
@@ -131,10 +147,6 @@ def debug_collect_sample(dictname):
             lst_url.append(url)
 
         if is_update:
-            clt_info.delete_many({
-                'dictionary': dictname, 'document': 'sample'
-            })
-
             lst_url.sort()
             lst_leaf.sort()
 
@@ -146,7 +158,7 @@ def debug_collect_sample(dictname):
                 'leafs': lst_leaf
             }
 
-            clt_info.insert_one(data)
+            db.info_set_doc(data)
 
 
 def debug_check_layout(dictname):
@@ -192,12 +204,12 @@ def debug_export_info(dictname, dirname='info'):
     dirpath = DIR.joinpath(dirname)
     dirpath.mkdir(parents=True, exist_ok=True)
 
-    for doc in db.clt_info.find({'dictionary': dictname}):
+    for doc in db.info_find(dictname):
         document = doc.get('document')
 
         logger.info('%s %s', dictname, document)
 
-        del doc['_id']
+        doc.pop('_id', None)
 
         filename = '{0}_{1}.json'.format(dictname, document)
         filepath = dirpath.joinpath(filename)
@@ -205,85 +217,451 @@ def debug_export_info(dictname, dirname='info'):
             json.dump(doc, fp, indent=4)
 
 
-def parse_html(dictname):
-    '''Collect data from dictionary.'''
-    lst_doc = db.html_get_all(dictname)
+def debug_explain(dictname):
+    '''Explain hot queries, fail if any of them scans whole collection.'''
+    doc = next(iter(db.data_find(dictname, fields=['title'])), None)
+    title = doc.get('title', '') if doc else ''
+
+    lst_scan = []
+    for name, plan, scan in db.explain(dictname, title):
+        logger.info('%s %s', name, plan)
+        if scan:
+            lst_scan.append(name)
+
+    if lst_scan:
+        raise AssertionError('Collection scan: {0}'.format(
+            ', '.join(lst_scan)))
+
+
+def __parse_doc(doc, state=None):
+    """Parse one html document.
+
+    Args:
+        doc (dict): document of html collection
+        state (dict, optional): parse state of urls, pages with same html
+            and layout fingerprint are skipped. Defaults to None.
+
+    Returns:
+        tuple: (url, data, error). data is None if nothing was collected,
+            error is None, 'skip', 'undefined' or 'error'.
+    """
+    url = doc.get('url')
+    html_hash = get_html_hash(doc.get('html'))
+
+    if state is not None:
+        prev = state.get(url)
+        if prev is not None and prev[0] == html_hash \
+                and get_layout().fingerprint(prev[1]) == prev[2]:
+            return url, None, 'skip'
+
+    data = None
+    error = None
+    try:
+        word = __doc2word(doc)
+        cats, layout_hash = word.fingerprint()
+        meta = {
+            'url': url,
+            'htmlHash': html_hash,
+            'layoutCats': cats,
+            'layoutHash': layout_hash
+        }
+
+        data = word.collect()
+        [info.update(meta) for info in data]
+
+        word.check_remain()
+
+    except ErrorUndefinedWord as e:
+        logger.exception(e)
+        error = 'undefined'
+
+    except Exception as e:
+        logger.exception(e)
+        error = 'error'
+
+    return url, data, error
+
+
+def __parse_init(state, corpus, backend):
+    '''Initialize parse worker process.'''
+    global __state
+    __state = state
+
+    db.connect(backend)
+    if corpus is not None:
+        db.use_corpus(corpus)
+
+
+def __parse_range(args):
+    """Parse all html documents in range of _id.
+
+    Args:
+        args (tuple): (dictname, first, last)
+
+    Returns:
+        list: list of (url, data, error)
+    """
+    dictname, first, last = args
+    lst_doc = db.html_get_range(dictname, first, last)
+    lst_rst = [__parse_doc(doc, __state) for doc in lst_doc]
+
+    return lst_rst
+
+
+def __get_lst_range(dictname, size=PARSE_CHUNK):
+    '''Split html collection into ranges of _id.'''
+    lst_id = db.html_get_ids(dictname)
+    lst_range = [(dictname, lst_id[i], lst_id[min(i + size, len(lst_id)) - 1])
+                 for i in range(0, len(lst_id), size)]
+
+    return lst_range
+
+
+def parse_html(dictname, workers=1, incremental=False, changed=False):
+    """Collect data from dictionary.
+
+    In incremental mode, only pages whose html or layout fingerprint changed
+    are parsed again, old data of those pages is deleted first.
+
+    In changed mode, only pages marked changed by a refresh crawl are read
+    and parsed again like in incremental mode, their marks are removed
+    after.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        workers (int, optional): number of parse processes. Defaults to 1.
+        incremental (bool, optional): incremental mode. Defaults to False.
+        changed (bool, optional): changed mode. Defaults to False.
+    """
+    state = None
+    lst_err_old = []
+    lst_udn_old = []
+    if incremental or changed:
+        # Changed pages are all parsed again
+        state = {} if changed else db.data_get_state(dictname)
+        lst_err_old = db.info_get(dictname, 'errors', [])
+        lst_udn_old = db.info_get(dictname, 'undefineds', [])
+
+    if changed:
+        # Changed pages are not in ranges of _id, few of them are parsed
+        pool = None
+        lst_rst = (__parse_doc(doc, state)
+                   for doc in db.html_get_changed(dictname))
+    elif workers > 1:
+        corpus = db.corpus.filepath if db.corpus is not None else None
+        pool = multiprocessing.Pool(workers, initializer=__parse_init,
+                                    initargs=(state, corpus, db.backend))
+        lst_range = __get_lst_range(dictname)
+        lst_rst = itertools.chain.from_iterable(
+            pool.imap(__parse_range, lst_range))
+    else:
+        pool = None
+        lst_rst = (__parse_doc(doc, state)
+                   for doc in db.html_get_all(dictname))
+
     lst_err = []  # Error words
     lst_udn = []  # Undefined words
+    set_done = set()  # Parsed words in incremental mode
+
+    def get_lst(lst_old, lst):
+        return [url for url in lst_old if url not in set_done] + lst
+
     count = 0
-    for doc in lst_doc:
-        count += 1
-        try:
-            url = doc.get('url')
+    count_skip = 0
+    writer = db.DataWriter(dictname)
+    try:
+        for url, data, error in lst_rst:
+            count += 1
+            if error == 'skip':
+                count_skip += 1
+                continue
 
             logger.info('%s %s', count, url)
 
-            word = __doc2word(doc)
-            data = word.collect()
-            db.data_insert(data, dictname)
+            if state is not None:
+                set_done.add(url)
+                writer.delete_url(url)
+
+            if data:
+                writer.insert(data)
+
+            if error == 'undefined':
+                lst_udn.append(url)
 
-            word.check_remain()
+                # Update database
+                writer.info('undefineds', get_lst(lst_udn_old, lst_udn))
 
-        except ErrorUndefinedWord as e:
-            logger.exception(e)
-            lst_udn.append(url)
+            elif error == 'error':
+                lst_err.append(url)
 
-            # Update database
-            db.info_update(dictname, 'undefineds', lst_udn)
+                # Update database
+                writer.info('errors', get_lst(lst_err_old, lst_err))
 
-        except Exception as e:
-            logger.exception(e)
-            lst_err.append(url)
+        # Remove words which are fixed
+        if state is not None:
+            writer.info('undefineds', get_lst(lst_udn_old, lst_udn))
+            writer.info('errors', get_lst(lst_err_old, lst_err))
 
-            # Update database
-            db.info_update(dictname, 'errors', lst_err)
+    finally:
+        writer.close()
 
+        if pool is not None:
+            pool.terminate()
+            pool.join()
 
-def collect_words(dictname):
-    '''Collect original words from data collection.'''
-    lst_cid = []
-    lst_title = []
-    lst_inf = []
-    list_word = []
+    # Marks are removed once data of pages is written
+    if changed:
+        db.html_set_unchanged(dictname, sorted(set_done))
 
-    # Get list cid, title, inf
+    logger.info('%s pages, %s skipped', count, count_skip)
+
+    # Ipa of all dictionaries changes with data of this dictionary
+    generate.build_ipa_table()
+
+
+def compress_html(dictname, size=PARSE_CHUNK):
+    """Strip and compress html of html collection.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        size (int, optional): number of documents per bulk write.
+    """
+    size_data, size_storage = db.html_get_size()
+
+    raw = 0
+    packed = 0
     count = 0
-    for doc in db.clt_data.find({'dictionary': dictname}):
+    lst_doc = []
+    for doc in db.html_get_raw(dictname):
         count += 1
+        html = doc.get('html')
+        if isinstance(html, str):
+            html = html.encode('utf-8')
 
-        title = doc.get('title', '')
-        cid = doc.get('cid', '')
+        root = lxml.html.fromstring(html)
+        html_strip = lxml.html.tostring(strip_tree(root))
+
+        html_packed = db.html_compress(html_strip)
+
+        raw += len(html)
+        packed += len(html_packed)
+        lst_doc.append((doc.get('_id'), html_packed))
+
+        if len(lst_doc) >= size:
+            logger.info('%s %s', count, doc.get('_id'))
+            db.html_set_compress(lst_doc)
+            lst_doc = []
+
+    db.html_set_compress(lst_doc)
+
+    size_data_new, size_storage_new = db.html_get_size()
+
+    logger.info('%s documents, html %s -> %s bytes (transfer saved %s)',
+                count, raw, packed, raw - packed)
+    logger.info('collection data %s -> %s bytes, storage %s -> %s bytes',
+                size_data, size_data_new, size_storage, size_storage_new)
 
-        logger.info('%s %s %s', count, title, cid)
 
-        lst_cid.append(cid)
-        lst_title.append(title)
+def export_corpus(dictname, filepath=None):
+    """Export html collection to corpus file.
 
-        lst_inf_title = get_all_inflection(title)
-        lst_inf_title.remove(title)
-        lst_inf.extend(lst_inf_title)
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        filepath (Path, optional): path to corpus file.
+            Defaults to corpus/<dictname>.corpus
+    """
+    if filepath is None:
+        filepath = DIR.joinpath('corpus', '{0}.corpus'.format(dictname))
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    lst_sample = db.html_get_sample_urls(dictname)
+    count = write_corpus(filepath, dictname, db.html_get_all(dictname),
+                         lst_sample)
+
+    logger.info('%s documents, %s bytes: %s',
+                count, filepath.stat().st_size, filepath)
+
+
+def __get_snapshot_collections(collection=None):
+    '''Get list of collection of snapshot, all if collection is None.'''
+    if collection is None:
+        return COLLECTIONS
+
+    if collection not in COLLECTIONS:
+        raise ValueError('Unknown collection: {0}'.format(collection))
+
+    return [collection]
+
+
+def __get_html_text(doc):
+    '''Get html doc with html as text, json has no bytes.'''
+    html = doc.get('html')
+    if isinstance(html, bytes):
+        doc.update({'html': html.decode('utf-8')})
+
+    return doc
+
+
+def export_snapshot(dictname, collection=None):
+    """Export collections to gzip JSON Lines files of snapshot directory.
+
+    Documents are streamed from storage cursor to file, memory does not
+    grow with size of collection. Html is exported decompressed, gzip of
+    whole file packs it better than zlib of each page.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        collection (str, optional): html, info or data. Defaults to all.
+    """
+    for name in __get_snapshot_collections(collection):
+        start = time.perf_counter()
+
+        lst_doc = db.export_find(name, dictname)
+        if name == 'html':
+            lst_doc = map(__get_html_text, lst_doc)
+
+        filepath = get_snapshot_path(dictname, name)
+        count = write_snapshot(filepath, lst_doc)
+
+        logger.info('%s %s documents, %s bytes in %.1fs: %s', name, count,
+                    filepath.stat().st_size, time.perf_counter() - start,
+                    filepath)
+
+
+def import_snapshot(dictname, collection=None, workers=1):
+    """Import snapshot files to collections.
+
+    Documents are read line by line and written in bulk, keyed like other
+    writes, so documents not in snapshot are kept. Html is compressed.
+    Ipa table and inflection index are rebuilt from imported data.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        collection (str, optional): html, info or data. Defaults to all.
+        workers (int, optional): number of inflection processes.
+            Defaults to 1.
+    """
+    for name in __get_snapshot_collections(collection):
+        filepath = get_snapshot_path(dictname, name)
+        if not filepath.exists():
+            logger.warning('No snapshot of %s: %s', name, filepath)
+            continue
+
+        start = time.perf_counter()
+        lst_doc = read_snapshot(filepath)
+
+        count = 0
+        if name == 'info':
+            for doc in lst_doc:
+                db.info_set_doc(doc)
+                count += 1
+
+        elif name == 'data':
+            for lst_batch in get_batches(lst_doc, db.BULK_SIZE):
+                db.data_insert(lst_batch, dictname)
+                count += len(lst_batch)
+
+        elif name == 'html':
+            for lst_batch in get_batches(lst_doc, SNAPSHOT_CHUNK):
+                for doc in lst_batch:
+                    if doc.get('html'):
+                        doc.update({
+                            'html': db.html_compress(doc.get('html')),
+                            'compress': db.COMPRESS
+                        })
+                db.html_upsert(lst_batch)
+                count += len(lst_batch)
+
+        logger.info('%s %s documents in %.1fs: %s', name, count,
+                    time.perf_counter() - start, filepath)
+
+        # Like after parse, files built from data collection are stale
+        if name == 'data':
+            generate.build_ipa_table()
+            build_inflection(dictname, workers)
+
+
+def __inflect_titles(lst_title):
+    '''Get inflections of titles in worker process.'''
+    lst_rst = [(title, get_all_inflection(title)) for title in lst_title]
+    generate.save_inflection_cache()
+
+    return lst_rst
+
+
+def __build_inflection(dictname, lst_title, workers=1):
+    '''Build inflection index of titles and load it.'''
+    lst_chunk = [lst_title[i:i + INFLECT_CHUNK]
+                 for i in range(0, len(lst_title), INFLECT_CHUNK)]
+
+    if workers > 1:
+        pool = multiprocessing.Pool(
+            workers, initializer=generate.use_inflection_cache)
+        lst_rst = pool.imap(__inflect_titles, lst_chunk)
+    else:
+        pool = None
+        generate.use_inflection_cache()
+        lst_rst = map(__inflect_titles, lst_chunk)
+
+    filepath = get_index_path(dictname)
+    try:
+        write_index(filepath, dictname,
+                    itertools.chain.from_iterable(lst_rst))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return InflectionIndex(filepath)
+
+
+def build_inflection(dictname, workers=1):
+    """Build inverted inflection index of titles in data collection.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        workers (int, optional): number of processes. Defaults to 1.
+    """
+    lst_title = sorted(set(doc.get('title', '') for doc in
+                           db.data_find(dictname, fields=['title'])))
+    __build_inflection(dictname, lst_title, workers)
 
-    lst_cid = list(set(lst_cid))
-    lst_title = list(set(lst_title))
-    lst_inf = list(set(lst_inf))
 
-    # Find original word
+def collect_words(dictname, workers=1):
+    """Collect original words from data collection.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        workers (int, optional): number of processes to build inflection
+            index. Defaults to 1.
+    """
+    set_cid = set()
+    set_title = set()
+
+    # Get list cid, title
     count = 0
-    for title in lst_title:
+    for doc in db.data_find(dictname, fields=['cid', 'title']):
         count += 1
 
-        logger.info('%s %s', count, title)
+        title = doc.get('title', '')
+        cid = doc.get('cid', '')
+
+        logger.info('%s %s %s', count, title, cid)
 
-        if title not in lst_inf:
-            list_word.append(title)
+        set_cid.add(cid)
+        set_title.add(title)
 
-    list_word = list(set(list_word))
+    lst_cid = sorted(set_cid)
+    lst_title = sorted(set_title)
 
-    # Sort list and add to database
-    lst_cid.sort()
-    lst_title.sort()
-    list_word.sort()
+    # Find original word, which is not inflection of another title
+    index = __build_inflection(dictname, lst_title, workers)
+    list_word = [t for t in lst_title if not index.is_inflection(t)]
 
+    logger.info('%s titles, %s words', len(lst_title), len(list_word))
+
+    # Add to database
     data = {
         'dictionary': dictname,
         'document': 'word',
@@ -292,10 +670,86 @@ def collect_words(dictname):
         'words': list_word
     }
 
-    db.clt_info.delete_many({'dictionary': dictname, 'document': 'word'})
-    db.clt_info.insert_one(data)
+    db.info_set_doc(data)
+
+
+def build_lookup(dictname):
+    """Build lookup file of titles and their inflections in data collection.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+    """
+    data = {}
+    for doc in db.data_find(dictname):
+        doc.pop('_id', None)
+        data.setdefault(doc.get('title', ''), []).append(doc)
+
+    inf_index = load_index(dictname)
+    generate.use_inflection_cache()
+
+    def get_item(title):
+        lst_inf = inf_index.get_forms(title) if inf_index else None
+        if lst_inf is None:
+            lst_inf = get_all_inflection(title)
+
+        return title, lst_inf, data.get(title)
+
+    write_lookup(get_lookup_path(dictname), dictname,
+                 (get_item(title) for title in sorted(data)))
+
+    generate.save_inflection_cache()
 
 
-def generate_book(dictname):
-    '''Generate book.'''
-    generate.generate_ebook(dictname)
+def lookup_word(dictname, word):
+    """Print blocks of word or inflection from lookup file as json.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        word (str): word or inflection
+    """
+    lookup = load_lookup(dictname)
+    if lookup is None:
+        raise FileNotFoundError('No lookup file of {0}, run export-lookup '
+                                'first'.format(dictname))
+
+    start = time.perf_counter()
+    lst_rst = lookup.lookup(word)
+    seconds = time.perf_counter() - start
+
+    logger.info('%s: %s titles in %.3fms', word, len(lst_rst), seconds * 1000)
+    print(json.dumps(lst_rst, ensure_ascii=False, indent=4))
+
+
+def search_word(dictname, word):
+    """Print words starting with word and words near word.
+
+    Args:
+        dictname (str): dictionary name eg. english, english-vietnamese
+        word (str): prefix or misspelled word
+    """
+    info = db.info_get_doc(dictname, 'word')
+    index = SearchIndex(info.get('titles', []), load_index(dictname))
+
+    start = time.perf_counter()
+    lst_prefix = index.prefix(word)
+    t_prefix = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lst_fuzzy = index.fuzzy(word)
+    t_fuzzy = time.perf_counter() - start
+
+    logger.info('%s keys, prefix %.3fms, fuzzy %.3fms', len(index),
+                t_prefix * 1000, t_fuzzy * 1000)
+    print(json.dumps({'prefix': lst_prefix, 'fuzzy': lst_fuzzy},
+                     ensure_ascii=False, indent=4))
+
+
+def generate_book(dictname, workers=1, incremental=False, fmt=None):
+    '''Generate book, .mobi or files of format eg. stardict, dictd.'''
+    if fmt is None or fmt == 'kindle':
+        generate.generate_ebook(dictname, workers=workers,
+                                incremental=incremental)
+    elif fmt in generate.WRITERS:
+        generate.generate_dictionary(dictname, fmt)
+    else:
+        raise ValueError('Unknown format: {0}'.format(fmt))
@@ -0,0 +1,183 @@
+import json
+import logging
+import mmap
+import struct
+
+logger = logging.getLogger(__name__)
+
+# Layout of corpus file:
+#   MAGIC
+#   html of every page, in order of export (append only)
+#   index: ENTRY of every page, sorted by url
+#   urls: url of every page, referenced by index
+#   meta: json {dictname, count, samples}
+#   FOOTER
+MAGIC = b'CAMBCRP1'
+ENTRY = struct.Struct('<QQQI')  # html offset, html size, url offset, url size
+FOOTER = struct.Struct('<QQQQ8s')  # index, urls, meta offset, count, MAGIC
+
+URL = 'https://dictionary.cambridge.org/us/dictionary/{dictname}/{word}'
+
+
+def write_corpus(filepath, dictname, lst_doc, lst_sample):
+    """Write html documents to corpus file.
+
+    Args:
+        filepath (Path): path to corpus file
+        dictname (str): dictionary name
+        lst_doc (iterable): documents of html collection
+        lst_sample (list): urls of sample documents
+
+    Returns:
+        int: number of documents
+    """
+    lst_entry = []
+    with open(filepath, 'wb') as fp:
+        fp.write(MAGIC)
+
+        # Html
+        for doc in lst_doc:
+            html = doc.get('html')
+            if isinstance(html, str):
+                html = html.encode('utf-8')
+
+            url = doc.get('url').encode('utf-8')
+            lst_entry.append((url, fp.tell(), len(html)))
+            fp.write(html)
+
+            if len(lst_entry) % 10000 == 0:
+                logger.info('%s %s', len(lst_entry), doc.get('url'))
+
+        lst_entry.sort(key=lambda x: x[0])
+
+        # Index
+        pos_index = fp.tell()
+        pos_url = pos_index + ENTRY.size * len(lst_entry)
+        offset = pos_url
+        for url, pos, size in lst_entry:
+            fp.write(ENTRY.pack(pos, size, offset, len(url)))
+            offset += len(url)
+
+        # Urls
+        for url, _, _ in lst_entry:
+            fp.write(url)
+
+        # Meta
+        pos_meta = fp.tell()
+        meta = {
+            'dictname': dictname,
+            'count': len(lst_entry),
+            'samples': sorted(lst_sample)
+        }
+        fp.write(json.dumps(meta).encode('utf-8'))
+
+        fp.write(FOOTER.pack(pos_index, pos_url, pos_meta, len(lst_entry),
+                             MAGIC))
+
+    return len(lst_entry)
+
+
+class Corpus(object):
+    '''Memory-mapped corpus file, serves documents like html collection.'''
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+
+        with open(self.filepath, 'rb') as fp:
+            self.__mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__mm)
+
+        if self.__mm[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a corpus file: {0}'.format(self.filepath))
+
+        footer = self.__mm[len(self.__mm) - FOOTER.size:]
+        pos_index, _, pos_meta, count, magic = FOOTER.unpack(footer)
+        if magic != MAGIC:
+            raise ValueError('Broken corpus file: {0}'.format(self.filepath))
+
+        self.__pos_index = pos_index
+        self.count = count
+
+        meta = self.__mm[pos_meta:len(self.__mm) - FOOTER.size]
+        meta = json.loads(meta.decode('utf-8'))
+        self.dictname = meta.get('dictname')
+        self.samples = meta.get('samples', [])
+
+    def __len__(self):
+        return self.count
+
+    def __entry(self, index):
+        '''Get (html offset, html size, url offset, url size) of index.'''
+        return ENTRY.unpack_from(self.__view,
+                                 self.__pos_index + ENTRY.size * index)
+
+    def get_url(self, index):
+        '''Get url as memoryview of corpus file.'''
+        _, _, pos, size = self.__entry(index)
+        return self.__view[pos:pos + size]
+
+    def get_html(self, index):
+        '''Get html as memoryview of corpus file.'''
+        pos, size, _, _ = self.__entry(index)
+        return self.__view[pos:pos + size]
+
+    def find(self, url):
+        '''Get index of url by binary search, -1 if not found.'''
+        url = url.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_url(middle).tobytes() < url:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.get_url(low) == url:
+            return low
+
+        return -1
+
+    def get_doc(self, index):
+        '''Get document like html collection, _id is index in corpus.'''
+        doc = {
+            '_id': index,
+            'dictionary': self.dictname,
+            'url': self.get_url(index).tobytes().decode('utf-8'),
+            'html': self.get_html(index).tobytes()
+        }
+        return doc
+
+    def __check(self, dictname):
+        '''Check that dictionary is the one of corpus.'''
+        if dictname != self.dictname:
+            raise ValueError('Corpus of {0}, not {1}'.format(self.dictname,
+                                                             dictname))
+
+    def html_get_one(self, dictname, word):
+        '''Get one doc.'''
+        self.__check(dictname)
+        url = URL.format(dictname=dictname, word=word)
+        index = self.find(url)
+        doc = self.get_doc(index) if index >= 0 else None
+        return doc
+
+    def html_get_all(self, dictname):
+        '''Get all doc.'''
+        self.__check(dictname)
+        return (self.get_doc(i) for i in range(self.count))
+
+    def html_get_ids(self, dictname):
+        '''Get sorted _id of all doc.'''
+        self.__check(dictname)
+        return list(range(self.count))
+
+    def html_get_range(self, dictname, first, last):
+        '''Get doc with _id in range [first, last].'''
+        self.__check(dictname)
+        return (self.get_doc(i) for i in range(first, last + 1))
+
+    def html_get_sample(self, dictname):
+        '''Get all sample doc.'''
+        self.__check(dictname)
+        lst_index = [self.find(url) for url in self.samples]
+        return (self.get_doc(i) for i in lst_index if i >= 0)
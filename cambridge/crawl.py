@@ -3,34 +3,48 @@ import pathlib
 
 from scrapy.crawler import CrawlerProcess
 
-import db
 from crawler.spiders.cambridge import CambridgeSpider
 
 logger = logging.getLogger(__name__)
 
+DIR_JOB = pathlib.Path(__file__).parent.joinpath('job')
 
-def crawl_html(dictname):
-    """Crawl html and store to mongodb.
+
+def crawl_html(dictname, refresh=False, url_base=None):
+    """Crawl html and store to html collection.
+
+    Refresh crawl sends conditional requests of crawled pages, pages not
+    modified or with same html are not written, changed pages are marked
+    for parse. It has its own job directory, remove it to refresh again.
 
     Args:
         dictname (str): Dictionary name eg. english, english-vietnamese
+        refresh (bool, optional): refresh crawl. Defaults to False.
+        url_base (str, optional): base url of site eg. of a stand-in
+            server. Defaults to Cambridge site.
     """
-    jobdir = pathlib.Path(__file__).parent.joinpath('job', dictname)
+    jobname = '{0}-refresh'.format(dictname) if refresh else dictname
+    jobdir = DIR_JOB.joinpath(jobname)
 
     # Create job directory
     jobdir.mkdir(parents=True, exist_ok=True)
 
     process = CrawlerProcess(settings={
-        'MONGO_URI': db.URI,
-        'MONGO_DATABASE': db.DBNAME,
+        'BUFFER_SIZE': 500,
+        'BUFFER_INTERVAL': 10,
+        'HTML_COMPRESS': True,
         'JOBDIR': str(jobdir),
         'ITEM_PIPELINES': {
-            'crawler.pipelines.MongoPipeline': 300,
+            'crawler.pipelines.BufferedPipeline': 300,
+        },
+        'DOWNLOADER_MIDDLEWARES': {
+            'crawler.middlewares.ConditionalMiddleware': 900,
         },
         'ROBOTSTXT_OBEY': False,
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/81.0.4044.122 Safari/537.36 Edg/81.0.416.64'
     })
 
     # Start crawl
-    process.crawl(CambridgeSpider, dictname=dictname, collection=db.HTML)
+    process.crawl(CambridgeSpider, dictname=dictname, refresh=refresh,
+                  url_base=url_base)
     process.start()
@@ -6,13 +6,14 @@
 import lxml.html
 import scrapy
 from itemloaders.processors import MapCompose, TakeFirst
+from word import strip_tree
 
 
 def get_article(html):
     tree = lxml.html.fromstring(html)
     lst = tree.cssselect('#page-content')
     if len(lst) == 1:
-        html = lxml.html.tostring(lst[0])
+        html = lxml.html.tostring(strip_tree(lst[0]))
 
     return html
 
@@ -25,3 +26,9 @@ class Page(scrapy.Item):
         input_processor=MapCompose(get_article),
         output_processor=TakeFirst()
     )
+    etag = scrapy.Field(
+        output_processor=TakeFirst()
+    )
+    lastModified = scrapy.Field(
+        output_processor=TakeFirst()
+    )
@@ -6,6 +6,7 @@
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter, is_item
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
 
 
 class CrawlSpiderMiddleware:
@@ -100,3 +101,33 @@ class CrawlDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class ConditionalMiddleware:
+    '''Send conditional requests of crawled pages, drop not modified ones.
+
+    Validators are of spider, they are only loaded by refresh crawl.
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_request(self, request, spider):
+        validators = getattr(spider, 'validators', None)
+        if validators is not None:
+            for name, value in validators.get_headers(request.url).items():
+                request.headers.setdefault(name, value)
+
+        return None
+
+    def process_response(self, request, response, spider):
+        validators = getattr(spider, 'validators', None)
+        if validators is not None and response.status == 304:
+            self.stats.inc_value('conditional/not_modified', spider=spider)
+            raise IgnoreRequest('Not modified: {0}'.format(request.url))
+
+        return response
@@ -4,34 +4,49 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 
-import pymongo
+import time
+
+import db
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
+from recrawl import get_html_hash
+from twisted.internet import defer, threads
+
 
+class BufferedPipeline:
+    '''Upsert pages in bulk from a thread instead of the reactor thread.
 
-class MongoPipeline:
+    Pages are written to storage of db module. In refresh crawl, pages
+    with same html are not written, only their new validators if any,
+    others are marked changed for parse.
+    '''
 
-    def __init__(self, mongo_uri, mongo_db):
-        self.mongo_uri = mongo_uri
-        self.mongo_db = mongo_db
+    def __init__(self, buffer_size, buffer_interval, compress, stats):
+        self.buffer_size = buffer_size
+        self.buffer_interval = buffer_interval
+        self.compress = compress
+        self.stats = stats
+
+        self.buffer = {}
+        self.buffer_validators = {}
+        self.time = time.monotonic()
+        self.deferred = defer.succeed(None)  # Last write
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            mongo_uri=crawler.settings.get('MONGO_URI'),
-            mongo_db=crawler.settings.get('MONGO_DATABASE')
+            buffer_size=crawler.settings.getint('BUFFER_SIZE', 500),
+            buffer_interval=crawler.settings.getint('BUFFER_INTERVAL', 10),
+            compress=crawler.settings.getbool('HTML_COMPRESS', False),
+            stats=crawler.stats
         )
 
     def open_spider(self, spider):
-        self.client = pymongo.MongoClient(self.mongo_uri)
-        self.db = self.client[self.mongo_db]
-
-        self.collection = self.db[spider.collection]
-        self.collection.create_index('url')
-        self.collection.create_index('dictionary')
+        db.get_storage()
 
     def close_spider(self, spider):
-        self.client.close()
+        self.flush(spider)
+        return self.deferred
 
     def process_item(self, item, spider):
         url = item.get('url')
@@ -39,9 +54,70 @@ class MongoPipeline:
         data = ItemAdapter(item).asdict()
         data.update({'dictionary': spider.dictname})
 
-        item = {'url': url}
-        self.collection.delete_many(item)
+        if data.get('html'):
+            html_hash = get_html_hash(data.get('html'))
+
+            validators = getattr(spider, 'validators', None)
+            if validators is not None:
+                if not validators.is_changed(url, html_hash):
+                    self.stats.inc_value('conditional/identical',
+                                         spider=spider)
+
+                    # Validators of server changed, keep new ones so next
+                    # refresh can get not modified
+                    etag = data.get('etag')
+                    modified = data.get('lastModified')
+                    if validators.is_stale(url, etag, modified):
+                        self.buffer_validators[url] = {
+                            'dictionary': spider.dictname,
+                            'url': url,
+                            'etag': etag,
+                            'lastModified': modified,
+                            'htmlHash': html_hash
+                        }
+                        self.__check_flush(spider)
+
+                    return item
+
+                data.update({'changed': True})
 
-        self.collection.insert_one(data)
+            data.update({'htmlHash': html_hash})
+
+        if self.compress and data.get('html'):
+            data.update({
+                'html': db.html_compress(data.get('html')),
+                'compress': db.COMPRESS
+            })
+
+        # Last page of same url wins
+        self.buffer[url] = data
+        self.__check_flush(spider)
 
         return item
+
+    def __check_flush(self, spider):
+        size = len(self.buffer) + len(self.buffer_validators)
+        if size >= self.buffer_size \
+                or time.monotonic() - self.time >= self.buffer_interval:
+            self.flush(spider)
+
+    def flush(self, spider):
+        '''Write buffered pages and validators in a thread, after previous
+        writes so the last page of an url wins.'''
+        self.time = time.monotonic()
+
+        if self.buffer:
+            lst_doc = list(self.buffer.values())
+            self.buffer = {}
+            self.__defer(spider, db.html_upsert, lst_doc)
+
+        if self.buffer_validators:
+            lst_doc = list(self.buffer_validators.values())
+            self.buffer_validators = {}
+            self.__defer(spider, db.html_set_validators, lst_doc)
+
+    def __defer(self, spider, func, lst_doc):
+        self.deferred.addCallback(
+            lambda _: threads.deferToThread(func, lst_doc))
+        self.deferred.addErrback(
+            lambda f: spider.logger.error(f.getTraceback()))
@@ -1,5 +1,8 @@
+from urllib.parse import urlparse
+
 import scrapy
 from crawler.items import Page
+from recrawl import Validators, get_header
 from scrapy.linkextractors import LinkExtractor
 from scrapy.loader import ItemLoader
 from scrapy.spiders import CrawlSpider, Rule
@@ -7,16 +10,24 @@ from scrapy.spiders import CrawlSpider, Rule
 
 class CambridgeSpider(CrawlSpider):
     name = 'cambridge'
-    allowed_domains = ['dictionary.cambridge.org']
 
-    url_start = 'https://dictionary.cambridge.org/us/browse/{0}/'
+    url_base = 'https://dictionary.cambridge.org'
+    url_start = '/us/browse/{0}/'
     url_dictionary = '/us/dictionary/{0}/'
     url_browse = '/us/browse/{0}/'
 
-    def __init__(self, dictname='english', *args, **kwargs):
+    def __init__(self, dictname='english', refresh=False, url_base=None,
+                 *args, **kwargs):
         self.dictname = dictname
 
-        url = self.url_start.format(dictname)
+        # Site may be a stand-in server of another base url
+        url_base = (url_base or self.url_base).rstrip('/')
+        self.allowed_domains = [urlparse(url_base).hostname]
+
+        # Validators of crawled pages, requests of them are conditional
+        self.validators = Validators(dictname) if refresh else None
+
+        url = url_base + self.url_start.format(dictname)
         self.start_urls = [url]
 
         url_dictionary = self.url_dictionary.format(dictname)
@@ -37,5 +48,8 @@ class CambridgeSpider(CrawlSpider):
         if not url.endswith('/'):
             il.add_value('url', url)
             il.add_value('html', response.body)
+            il.add_value('etag', get_header(response.headers, 'ETag'))
+            il.add_value('lastModified',
+                         get_header(response.headers, 'Last-Modified'))
 
         return il.load_item()
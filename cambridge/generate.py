@@ -1,20 +1,56 @@
+import functools
+import gzip
+import hashlib
+import io
 import itertools
+import json
 import logging
+import multiprocessing
+import os
+import re
 import shutil
+import sqlite3
+import string
+import time
+import types
 from datetime import date
 from pathlib import Path
 from subprocess import PIPE, STDOUT, Popen
 
 import yaml
-from lemminflect import getAllInflections
 
 import db
+from inflection import load_index
+from writer import WRITERS
 
 
 class ErrorEmptyDefinition(Exception):
     pass
 
 
+class Template(object):
+    '''Format template compiled once to literal and field parts.
+
+    Whitespace with line break is removed, it only indents the template.
+    '''
+
+    def __init__(self, text):
+        text = re.sub(r'\s*\n\s*', '', text)
+
+        self.lst_part = [(literal, field) for literal, field, _, _
+                         in string.Formatter().parse(text)]
+
+    def render(self, data: dict) -> str:
+        '''Render template with fields of data.'''
+        lst = []
+        for literal, field in self.lst_part:
+            lst.append(literal)
+            if field is not None:
+                lst.append(data[field])
+
+        return ''.join(lst)
+
+
 logger = logging.getLogger(__name__)
 
 logging.basicConfig(
@@ -34,6 +70,56 @@ DOWNLOAD = DIR.parent.joinpath('download')
 
 TMP_FILES = ['index.html', 'index.opf', 'info.html']
 
+ENTRY = Template('''
+    <idx:entry name="english" scriptable="yes" spell="yes">
+        <idx:orth value="{title}"><b>{title}</b>
+            <idx:infl>{lst_iform}</idx:infl>
+        </idx:orth>
+        {dash_br} {ipa} {dash} {pos}
+        {definition}
+    </idx:entry>
+    <mbp:pagebreak />
+''')
+IFORM = '<idx:iform value="{0}" />'
+
+# Block of article of StarDict and dictd, no Kindle markup
+ARTICLE = Template('''
+    <b>{title}</b>
+    {dash_br} {ipa} {dash} {pos}
+    {definition}
+''')
+
+PAGE_SIZE = 4 * 1024 * 1024  # Size limit of entries per page file in bytes
+RENDER_CHUNK = 500  # Number of words per render task
+RENDER_FLUSH = 5000  # Number of new words per write to render cache
+
+# Bump when rendering of entry changes outside of code hashed into render
+# version, see __get_render_version. Render cache is then invalid.
+RENDER_VERSION = 2
+
+RENDER_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS render (key TEXT PRIMARY KEY, entries TEXT);
+'''
+
+IPA_TABLE = DIR.joinpath('index', 'ipa.json.gz')
+
+INFLECTION_CACHE = DIR.joinpath('inflection.sqlite')
+INFLECTION_LRU = 65536  # Number of words or phrases kept in memory
+INFLECTION_FLUSH = 5000  # Number of new words per write to disk cache
+INFLECTION_TIMEOUT = 120  # Seconds to wait for lock of other writers
+
+INFLECTION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS inflection (word TEXT PRIMARY KEY, forms TEXT);
+'''
+
+inflection_cache = None  # Connection to on-disk cache of inflections
+__inflection_pid = None  # Process which opened connection
+__inflection_pending = {}  # New inflections not written to disk cache
+
+__render_state = None  # Prefetched data of render worker process
+__render_version = None  # Hash of render code, see __get_render_version
+
 PRIORITY = {
     'cald4': 1,
     'cald4-us': 2,
@@ -42,51 +128,139 @@ PRIORITY = {
 }
 
 
-def get_word_inflection(word: str) -> list:
-    '''Get all inflections of word by using lemminflect library.
+def use_inflection_cache(filepath=INFLECTION_CACHE):
+    """Use on-disk cache of word inflections, shared by collect and generate.
+
+    Cache is cleared when version of lemminflect changes. Connection and
+    pending inflections inherited by a forked worker are dropped without
+    being used, worker opens its own connection. Workers write to cache at
+    the same time, it is in WAL mode and a writer waits for lock.
 
     Args:
-        word (str): word
+        filepath (Path, optional): path to cache file, None to disable.
+            Defaults to INFLECTION_CACHE.
+    """
+    global inflection_cache, __inflection_pid
 
-    Returns:
-        list: list of inflections
-    '''
-    lst_inf = [word]
+    if inflection_cache is not None and __inflection_pid != os.getpid():
+        inflection_cache = None
+        __inflection_pending.clear()
+
+    if inflection_cache is not None:
+        save_inflection_cache()
+        inflection_cache.close()
+        inflection_cache = None
+
+    __get_word_inflection.cache_clear()
+    __get_all_inflection.cache_clear()
+
+    if filepath is None:
+        return
+
+    import lemminflect
+
+    conn = sqlite3.connect(str(filepath), timeout=INFLECTION_TIMEOUT)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(INFLECTION_SCHEMA)
+
+    sql = 'SELECT value FROM meta WHERE key = ?'
+    row = conn.execute(sql, ('version',)).fetchone()
+    if row is None or row[0] != lemminflect.__version__:
+        conn.execute('DELETE FROM inflection')
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                     ('version', lemminflect.__version__))
+        conn.commit()
+
+    inflection_cache = conn
+    __inflection_pid = os.getpid()
+
+
+def save_inflection_cache():
+    '''Write new inflections to on-disk cache.'''
+    if inflection_cache is not None and __inflection_pending:
+        sql = 'INSERT OR REPLACE INTO inflection VALUES (?, ?)'
+        inflection_cache.executemany(sql, [
+            (word, json.dumps(lst_inf))
+            for word, lst_inf in __inflection_pending.items()
+        ])
+        inflection_cache.commit()
+        __inflection_pending.clear()
 
+    logger.info('inflection %s', __get_word_inflection.cache_info())
+
+
+def __expand_inflection(word):
+    '''Get closure of inflections of word, word first then sorted.'''
+    from lemminflect import getAllInflections
+
+    set_done = set()
     lst_wait = [word]
-    lst_done = []
     while lst_wait:
-        word_next = lst_wait[-1]
-        lst_wait.pop(-1)
-
-        if word_next in lst_done:
+        word_next = lst_wait.pop()
+        if word_next in set_done:
             continue
 
-        lst = []
-        [lst.extend(list(v)) for _, v in getAllInflections(word_next).items()]
-        lst_done.append(word_next)
+        set_done.add(word_next)
+        for forms in getAllInflections(word_next).values():
+            lst_wait.extend(f for f in forms if f not in set_done)
+
+    set_done.discard(word)
+
+    return (word,) + tuple(sorted(set_done))
 
-        lst_inf.extend(lst)
-        lst_wait.extend(lst)
-        lst_wait = list(set(lst_wait))
 
-    lst_inf = list(set(lst_inf))
+@functools.lru_cache(maxsize=INFLECTION_LRU)
+def __get_word_inflection(word):
+    '''Get inflections of word from memory, disk cache or lemminflect.'''
+    if inflection_cache is not None:
+        lst_inf = __inflection_pending.get(word)
+        if lst_inf is not None:
+            return lst_inf
+
+        sql = 'SELECT forms FROM inflection WHERE word = ?'
+        row = inflection_cache.execute(sql, (word,)).fetchone()
+        if row is not None:
+            return tuple(json.loads(row[0]))
+
+    lst_inf = __expand_inflection(word)
+
+    if inflection_cache is not None:
+        __inflection_pending[word] = lst_inf
+        if len(__inflection_pending) >= INFLECTION_FLUSH:
+            save_inflection_cache()
 
     return lst_inf
 
 
-def get_all_inflection(pharse: str) -> list:
-    '''Get all inflections of word or phase'''
-    lst_word_inf = [get_word_inflection(word)
+def get_word_inflection(word: str) -> list:
+    '''Get all inflections of word by using lemminflect library.
+
+    Args:
+        word (str): word
+
+    Returns:
+        list: list of inflections, word first
+    '''
+    return list(__get_word_inflection(word))
+
+
+@functools.lru_cache(maxsize=INFLECTION_LRU)
+def __get_all_inflection(pharse):
+    lst_word_inf = [__get_word_inflection(word)
                     for word in pharse.split(' ') if word]
-    lst_combination = list(itertools.product(*lst_word_inf))
+    lst_combination = itertools.product(*lst_word_inf)
     lst_phase_inf = [' '.join(l) for l in lst_combination]
 
     if pharse in lst_phase_inf:
         lst_phase_inf.remove(pharse)
     lst_phase_inf.insert(0, pharse)
 
-    return lst_phase_inf
+    return tuple(lst_phase_inf)
+
+
+def get_all_inflection(pharse: str) -> list:
+    '''Get all inflections of word or phase'''
+    return list(__get_all_inflection(pharse))
 
 
 def __generate_entry(data: dict) -> str:
@@ -98,53 +272,30 @@ def __generate_entry(data: dict) -> str:
     Returns:
         str: entry block
     '''
-    entry = '''
-        <idx:entry name="english" scriptable="yes" spell="yes">
-            <idx:orth value="{title}"><b>{title}</b>
-                <idx:infl>{lst_iform}</idx:infl>
-            </idx:orth>
-            {dash_br} {ipa} {dash} {pos}
-            {definition}
-        </idx:entry>
-        <mbp:pagebreak />
-    '''
-    str_iform = '<idx:iform value="{form}" />'
-
-    lst_iform = ''
-    for form in data.get('lst_inf', []):
-        iform = str_iform
-        iform = iform.format(form=form)
-
-        lst_iform += iform
+    lst_inf = data.get('lst_inf', [])
+    lst_iform = IFORM.format('" /><idx:iform value="'.join(lst_inf)) \
+        if lst_inf else ''
 
     data.update({'lst_iform': lst_iform})
-    entry = entry.format(**data)
 
-    return entry
+    return ENTRY.render(data)
 
 
-def __get_ipa_data(word: str) -> dict:
-    '''Collect ipa info from multiple dictionary in db.
+def __add_ipa_data(data: dict, doc: dict) -> None:
+    '''Add ipa of block to ipa data {pos: [us, uk]}, first one is kept.'''
+    pos = doc.get('pos', [None])[0]
+    lst = data.get(pos, [None, None])
+    if doc.get('ipaUS') and not lst[0]:
+        lst[0] = doc.get('ipaUS')[0]
+        data.update({pos: lst})
 
-    Args:
-        word (str): word
+    if doc.get('ipaUK') and not lst[1]:
+        lst[1] = doc.get('ipaUK')[0]
+        data.update({pos: lst})
 
-    Returns:
-        dict: ipa data {pos: [us, uk]}
-    '''
-    filter = {'title': word}
-    data = {}
-    for doc in db.clt_data.find(filter):
-        pos = doc.get('pos', [None])[0]
-        lst = data.get(pos, [None, None])
-        if doc.get('ipaUS') and not lst[0]:
-            lst[0] = doc.get('ipaUS')[0]
-            data.update({pos: lst})
-
-        if doc.get('ipaUK') and not lst[1]:
-            lst[1] = doc.get('ipaUK')[0]
-            data.update({pos: lst})
 
+def __fill_ipa_data(data: dict) -> None:
+    '''Use ipa US as UK and vice versa when one of them is missing.'''
     for pos, ipa in data.items():
         if ipa[0] is None and ipa[1]:
             ipa[0] = ipa[1]
@@ -153,6 +304,68 @@ def __get_ipa_data(word: str) -> dict:
 
         data.update({pos: ipa})
 
+
+def build_ipa_table(filepath=IPA_TABLE):
+    """Collect ipa info of every title from multiple dictionary in db.
+
+    Table is a json {title: [[pos, us, uk]]}, pos in order of first block.
+
+    Args:
+        filepath (Path, optional): path to table. Defaults to IPA_TABLE.
+    """
+    data_title = {}
+    fields = ['title', 'pos', 'ipaUS', 'ipaUK']
+    for doc in db.data_find(fields=fields):
+        data = data_title.setdefault(doc.get('title'), {})
+        __add_ipa_data(data, doc)
+
+    table = {}
+    for title, data in data_title.items():
+        if data:
+            __fill_ipa_data(data)
+            table[title] = [[pos] + ipa for pos, ipa in data.items()]
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(filepath, 'wt', encoding='utf-8') as fp:
+        json.dump(table, fp, ensure_ascii=False, sort_keys=True)
+
+    logger.info('ipa of %s titles: %s', len(table), filepath)
+
+
+def load_ipa_table(filepath=IPA_TABLE) -> dict:
+    """Load ipa table, None if not built.
+
+    Args:
+        filepath (Path, optional): path to table. Defaults to IPA_TABLE.
+
+    Returns:
+        dict: {title: {pos: [us, uk]}}
+    """
+    filepath = Path(filepath)
+    if not filepath.exists():
+        return None
+
+    with gzip.open(filepath, 'rt', encoding='utf-8') as fp:
+        table = json.load(fp)
+
+    return {title: {pos: [us, uk] for pos, us, uk in lst}
+            for title, lst in table.items()}
+
+
+def __prefetch_block(dictname: str) -> dict:
+    """Stream data collection of dictionary once, group blocks by title.
+
+    Args:
+        dictname (str): name of dictionary
+
+    Returns:
+        dict: {title: [(sequence, block)]}, sequence is natural order
+    """
+    data = {}
+    for seq, doc in enumerate(db.data_find(dictname)):
+        data.setdefault(doc.get('title'), []).append((seq, doc))
+
     return data
 
 
@@ -165,7 +378,7 @@ def __get_block_entry(doc: dict) -> dict:
     Returns:
         dict: data. Keywords: title, ipa, pos, def
     '''
-    del doc['_id']
+    doc.pop('_id', None)
 
     # Update cid
     cid = doc.get('cid', '-1')
@@ -181,54 +394,50 @@ def __get_block_entry(doc: dict) -> dict:
     pos = '<i>{0}</i>'.format(pos) if pos else ''
 
     # Get def
-    text = ''
+    lst_text = []
     for sense in doc.get('posSense', []):
-        text_sense = ''
+        lst_sense = []
         guide = ' '.join(sense.get('guideWord', []))
         if guide:
-            guide = '<br>{0}'.format(guide)
-            text_sense += guide
+            lst_sense.append('<br>')
+            lst_sense.append(guide)
 
         title = sense.get('pvTitle')
         if title:
-            title = '<br>{0}'.format(title)
-            text_sense += title
-            text_sense += title
+            lst_sense.append('<br>')
+            lst_sense.append(title)
+            lst_sense.append('<br>')
+            lst_sense.append(title)
 
         # defBlock
-        text_def = ''
-        count = 0
+        lst_def = []
         for block in sense.get('defBlock', []):
-            count += 1
-            prefix = '&#9726; '
-
             define = ' '.join(block.get('define', []))
             if define:
-                define = '<br>{0}{1}'.format(prefix, define)
-                text_def += define
+                lst_def.append('<br>&#9726; ')
+                lst_def.append(define)
 
             translation = ' '.join(block.get('trans', []))
             if translation:
-                translation = '<br><i>{0}</i>'.format(translation)
-                text_def += translation
+                lst_def.append('<br><i>')
+                lst_def.append(translation)
+                lst_def.append('</i>')
 
-            examp = block.get('examp', [])
-            bull = '&nbsp;&nbsp; &bull;'
-            lst = ['<i>{0} {1}</i>'.format(bull, eg)
-                   for eg in examp]
-            if lst:
-                examp = '<br>' + '<br>'.join(lst)
-                text_def += examp
+            for eg in block.get('examp', []):
+                lst_def.append('<br><i>&nbsp;&nbsp; &bull; ')
+                lst_def.append(eg)
+                lst_def.append('</i>')
 
         # Append block
-        text_sense = text_sense + text_def if text_def else ''
-
-        text += text_sense
+        if lst_def:
+            lst_text.extend(lst_sense)
+            lst_text.extend(lst_def)
 
-    if not text:
+    if not lst_text:
         raise ErrorEmptyDefinition
 
-    text += '<br>'
+    lst_text.append('<br>')
+    text = ''.join(lst_text)
 
     # Update document
     doc.update({
@@ -261,21 +470,97 @@ def __get_be_removed_index(lst_info):
     return lst_remove
 
 
-def __get_lst_block(dictname: str, word: str) -> list:
-    '''Get list of defination block.'''
-    lst_title = get_all_inflection(word)
+def __get_lst_source(word: str, data_block: dict, inf_index=None) -> tuple:
+    '''Get inflections of word and their blocks from prefetched data.'''
+    lst_title = inf_index.get_forms(word) if inf_index is not None else None
+    if lst_title is None:
+        lst_title = get_all_inflection(word)
+
+    # Blocks of all inflections, in natural order of data collection
+    lst_doc = []
+    for title in set(lst_title):
+        lst_doc.extend(data_block.get(title, []))
+    lst_doc.sort(key=lambda x: x[0])
 
+    return lst_title, lst_doc
+
+
+def __get_code_data(code: types.CodeType) -> list:
+    '''Get bytecode, names and constants of code, nested code included.'''
+    lst_const = []
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            lst_const.append(__get_code_data(const))
+        elif isinstance(const, frozenset):
+            # Order of set depends on hash seed of process
+            lst_const.append(sorted(map(repr, const)))
+        else:
+            lst_const.append(repr(const))
+
+    return [code.co_code.hex(), list(code.co_names), lst_const]
+
+
+def __get_render_version() -> str:
+    """Get hash of code and constants rendering entry from blocks.
+
+    Bytecode of functions turning blocks into entries is hashed with
+    PRIORITY, templates and RENDER_VERSION, so a change of any of them
+    invalidates render cache. Changes of comments do not, a new Python
+    version does.
+
+    Returns:
+        str: sha1 hex digest
+    """
+    global __render_version
+
+    if __render_version is None:
+        lst_func = [Template.render, __generate_entry, __get_block_entry,
+                    __get_be_removed_index, __get_lst_block]
+        data = [
+            RENDER_VERSION,
+            [__get_code_data(func.__code__) for func in lst_func],
+            sorted(PRIORITY.items()),
+            ENTRY.lst_part,
+            IFORM
+        ]
+        text = json.dumps(data, ensure_ascii=False)
+        __render_version = hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    return __render_version
+
+
+def __get_render_key(word: str, lst_title: list, lst_doc: list,
+                     data_ipa: dict) -> str:
+    '''Get hash of render version and all source data of word.'''
+    lst_source = []
+    for _, doc in lst_doc:
+        doc = {k: v for k, v in doc.items() if k != '_id'}
+        ipa = list(data_ipa.get(doc.get('title'), {}).items())
+        lst_source.append([doc, ipa])
+
+    text = json.dumps([word, lst_title, lst_source], ensure_ascii=False,
+                      sort_keys=True, default=str)
+
+    sha1 = hashlib.sha1(__get_render_version().encode('utf-8'))
+    sha1.update(text.encode('utf-8'))
+
+    return sha1.hexdigest()
+
+
+def __get_lst_block(lst_title: list, lst_doc: list, data_ipa: dict) -> list:
+    '''Get list of defination block from prefetched data.'''
     lst_block = []
     lst_block_cid = []
-    filter = {'dictionary': dictname, 'title': {'$in': lst_title}}
-    for doc in db.clt_data.find(filter):
-        data_ipa = __get_ipa_data(doc.get('title'))
+    for _, doc in lst_doc:
+        # Block may be shared by inflections of many words
+        doc = dict(doc)
+        data_ipa_title = data_ipa.get(doc.get('title'), {})
 
         pos = doc.get('pos', [None])[0]
 
-        lst_ipa = data_ipa.get(pos, [None, None])
-        if lst_ipa[0] is None and data_ipa:
-            lst_ipa = list(data_ipa.values())[0]
+        lst_ipa = data_ipa_title.get(pos, [None, None])
+        if lst_ipa[0] is None and data_ipa_title:
+            lst_ipa = list(data_ipa_title.values())[0]
 
         doc.update({
             'pos': pos,
@@ -304,64 +589,271 @@ def __get_lst_block(dictname: str, word: str) -> list:
     return lst_block_rst
 
 
-def __generate_html(info, dir_rst, lst_page):
-    '''Generate html files.'''
-    file_html = DIR_TMP.joinpath('index.html')
-    with open(file_html) as fp:
-        html_tmp = fp.read()
+def is_same_file(filepath: Path, data: bytes) -> bool:
+    '''Check if file has the same bytes as data.'''
+    filepath = Path(filepath)
+    if filepath.exists() and filepath.stat().st_size == len(data):
+        with open(filepath, 'rb') as fp:
+            return fp.read() == data
 
-    lst_item = ''
-    lst_itemref = ''
+    return False
 
-    for index in range(len(lst_page)):
-        info.update({'lst_entry': lst_page[index]})
-        html_text = html_tmp.format(**info)
 
-        filename = '{0}.html'.format(index)
-        filepath = dir_rst.joinpath(filename)
-        with open(filepath, 'w', encoding='utf-8') as fp:
-            fp.write(html_text)
+def write_if_changed(filepath: Path, data: bytes) -> bool:
+    '''Write data to file unless file has the same bytes.'''
+    if is_same_file(filepath, data):
+        return False
 
-        item = '<item id="{0}" href="{0}.html" media-type="application/xhtml+xml" />'
-        item = item.format(index)
-        lst_item += item
+    with open(filepath, 'wb') as fp:
+        fp.write(data)
 
-        itemref = '<itemref idref="{0}" />'
-        itemref = itemref.format(index)
-        lst_itemref += itemref
+    return True
 
-        info.update({
-            'lst_item': lst_item,
-            'lst_itemref': lst_itemref
-        })
+
+class RenderCache(object):
+    '''Rendered entries of words keyed by hash of their source data.
+
+    Only worker processes read it, only main process writes it. Entries
+    not used by a generate are deleted when it is closed after all words
+    were rendered.
+    '''
+
+    def __init__(self, filepath, readonly=False):
+        self.filepath = str(filepath)
+        self.readonly = readonly
+
+        self.conn = sqlite3.connect(self.filepath)
+        if not readonly:
+            self.conn.executescript(RENDER_SCHEMA)
+
+        self.set_used = set()
+        self.pending = {}
+
+    def get(self, key):
+        '''Get list of entries, None if not cached.'''
+        lst_entry = self.pending.get(key)
+        if lst_entry is not None:
+            return lst_entry
+
+        sql = 'SELECT entries FROM render WHERE key = ?'
+        row = self.conn.execute(sql, (key,)).fetchone()
+
+        return json.loads(row[0]) if row else None
+
+    def add(self, key, lst_entry, new):
+        '''Mark entries of key as used, store them if new.'''
+        self.set_used.add(key)
+        if new:
+            self.pending[key] = lst_entry
+            if len(self.pending) >= RENDER_FLUSH:
+                self.flush()
+
+    def flush(self):
+        '''Write new entries to cache file.'''
+        if self.pending:
+            sql = 'INSERT OR REPLACE INTO render VALUES (?, ?)'
+            self.conn.executemany(sql, [
+                (key, json.dumps(lst, ensure_ascii=False))
+                for key, lst in self.pending.items()
+            ])
+            self.conn.commit()
+            self.pending.clear()
+
+    def close(self, prune=True):
+        """Write new entries, delete unused ones and close.
+
+        Args:
+            prune (bool, optional): delete entries not used, only when all
+                words were rendered. Defaults to True.
+        """
+        if not self.readonly:
+            self.flush()
+
+        if not self.readonly and prune:
+            lst_key = [row[0] for row in
+                       self.conn.execute('SELECT key FROM render')]
+            lst_key = [(k,) for k in lst_key if k not in self.set_used]
+            self.conn.executemany('DELETE FROM render WHERE key = ?', lst_key)
+            self.conn.commit()
+
+            logger.info('render cache %s entries, %s deleted',
+                        len(self.set_used), len(lst_key))
+
+        self.conn.close()
+
+
+class PageWriter(object):
+    '''Stream entries to page files of book directory.
+
+    Each letter starts a new page, a page is also rolled over when its
+    size reaches limit, so pages keep alphabetical order. In incremental
+    mode a page is kept in memory and only written if its bytes changed,
+    to a staging directory moved into book directory on close. On error
+    staging directory is removed, book directory is left as it was.
+    '''
+
+    def __init__(self, dir_rst, info, size=PAGE_SIZE, incremental=False):
+        self.dir_rst = dir_rst
+        self.size = size
+        self.incremental = incremental
+
+        file_html = DIR_TMP.joinpath('index.html')
+        with open(file_html) as fp:
+            html_tmp = fp.read()
+
+        head, tail = html_tmp.split('{lst_entry}')
+        self.head = head.format(**info).encode('utf-8')
+        self.tail = tail.format(**info).encode('utf-8')
+
+        self.count = 0  # Number of pages
+        self.count_changed = 0  # Number of written pages in incremental mode
+        self.key = None  # Letter of current page
+        self.fp = None
+        self.size_page = 0
+
+        # Changed pages of incremental mode, moved to book on close
+        self.dir_stage = None
+        if incremental:
+            self.dir_stage = dir_rst.with_name(dir_rst.name + '.stage')
+            if self.dir_stage.exists():
+                shutil.rmtree(self.dir_stage)
+            self.dir_stage.mkdir(parents=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __get_path(self, index, directory=None):
+        directory = directory or self.dir_rst
+        return directory.joinpath('{0}.html'.format(index))
+
+    def __close_page(self):
+        if self.fp is not None:
+            self.fp.write(self.tail)
+            if self.incremental:
+                data = self.fp.getvalue()
+                if not is_same_file(self.__get_path(self.count - 1), data):
+                    filepath = self.__get_path(self.count - 1,
+                                               self.dir_stage)
+                    with open(filepath, 'wb') as fp:
+                        fp.write(data)
+                    self.count_changed += 1
+            self.fp.close()
+            self.fp = None
+
+    def __open_page(self):
+        self.__close_page()
+
+        if self.incremental:
+            self.fp = io.BytesIO()
+        else:
+            self.fp = open(self.__get_path(self.count), 'wb')
+        self.fp.write(self.head)
+
+        self.count += 1
+        self.size_page = 0
+
+    def write(self, key, entry):
+        '''Write entry of letter key to page.'''
+        data = entry.encode('utf-8')
+
+        if self.fp is None or key != self.key:
+            roll = True
+        else:
+            roll = 0 < self.size < self.size_page + len(data)
+
+        if roll:
+            self.__open_page()
+            self.key = key
+
+        self.fp.write(data)
+        self.size_page += len(data)
+
+    def close(self):
+        '''Close current page, remove pages of previous generate left.'''
+        # Book without entries still has a page
+        if self.count == 0:
+            self.__open_page()
+
+        self.__close_page()
+
+        if not self.incremental:
+            return
+
+        for filepath in self.dir_stage.iterdir():
+            os.replace(filepath, self.dir_rst.joinpath(filepath.name))
+        self.dir_stage.rmdir()
+
+        index = self.count
+        while self.__get_path(index).exists():
+            self.__get_path(index).unlink()
+            index += 1
+
+    def abort(self):
+        '''Close current page without writing it, book is kept.'''
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+        if self.dir_stage is not None:
+            shutil.rmtree(self.dir_stage, ignore_errors=True)
+
+
+def __load_info(dictname: str) -> dict:
+    '''Load config data of dictionary.'''
+    filepath = DIR_TMP.joinpath('{0}.yaml'.format(dictname))
+    with open(filepath) as stream:
+        info = yaml.safe_load(stream)
+
+    info.update({'generateDay': date.today()})
 
     return info
 
 
-def __generate_directory(dictname: str, lst_page: list) -> None:
-    '''Generate dictionary directory from template.
+def __prepare_directory(dictname: str, incremental=False) -> tuple:
+    """Create empty dictionary directory and load config data.
 
     Args:
         dictname (str): name of dictionary
-        lst_page (list): list of page
+        incremental (bool, optional): keep files of directory.
+            Defaults to False.
 
     Returns:
-        str: path to opf file
-    '''
+        tuple: (path to directory, config data)
+    """
     dir_rst = DIR_OUT.joinpath(dictname)
-    if dir_rst.exists():
+    if dir_rst.exists() and not incremental:
         shutil.rmtree(dir_rst)
     dir_rst.mkdir(parents=True, exist_ok=True)
 
-    # Load config data
-    filepath = DIR_TMP.joinpath('{0}.yaml'.format(dictname))
-    with open(filepath) as stream:
-        info = yaml.safe_load(stream)
+    return dir_rst, __load_info(dictname)
 
-    info.update({'generateDay': date.today()})
 
-    # Generate html
-    info = __generate_html(info, dir_rst, lst_page)
+def __generate_directory(dictname: str, dir_rst: Path, info: dict,
+                         count: int) -> Path:
+    """Generate dictionary directory from template, pages are written.
+
+    Args:
+        dictname (str): name of dictionary
+        dir_rst (Path): path to directory
+        info (dict): config data
+        count (int): number of pages
+
+    Returns:
+        Path: path to opf file
+    """
+    item = '<item id="{0}" href="{0}.html" media-type="application/xhtml+xml" />'
+    itemref = '<itemref idref="{0}" />'
+
+    info.update({
+        'lst_item': ''.join(item.format(i) for i in range(count)),
+        'lst_itemref': ''.join(itemref.format(i) for i in range(count))
+    })
 
     # Copy template files
     for filename in TMP_FILES:
@@ -376,49 +868,213 @@ def __generate_directory(dictname: str, lst_page: list) -> None:
 
         # Write to file
         filepath = dir_rst.joinpath(filename)
-        with open(filepath, 'w', encoding='utf-8') as fp:
-            fp.write(text)
+        write_if_changed(filepath, text.encode('utf-8'))
 
     # Copy cover
     cover = '{0}.jpg'.format(dictname)
     src = DIR_TMP.joinpath(cover)
     target = dir_rst.joinpath(cover)
-    shutil.copy(src, target)
+    with open(src, 'rb') as fp:
+        write_if_changed(target, fp.read())
 
     file_opf = dir_rst.joinpath('index.opf')
 
     return file_opf
 
 
-def generate_ebook(dictname):
-    # Get list of word
-    filter = {'dictionary': dictname, 'document': 'word'}
-    info = db.clt_info.find_one(filter)
-    lst_word = [w.strip() for w in info.get('words', [])]
+def __render_words(lst_word, data_block, data_ipa, inf_index, cache=None):
+    """Render entries of words in order.
 
-    lst_page = []
-    text_page = ''
-    prev = '0'
-    count = 0
+    Args:
+        lst_word (list): list of word
+        data_block (dict): prefetched blocks
+        data_ipa (dict): ipa table
+        inf_index (InflectionIndex): inflection index, may be None
+        cache (RenderCache, optional): render cache. Defaults to None.
+
+    Yields:
+        tuple: (letter, key, list of entries, True if rendered)
+    """
     for word in lst_word:
         char = word[0].lower() if word[0].isalpha() else '0'
-        if char != prev:
-            if text_page:
-                lst_page.append(text_page)
 
-            prev = char
-            text_page = ''
+        lst_title, lst_doc = __get_lst_source(word, data_block, inf_index)
+
+        key = None
+        if cache is not None:
+            key = __get_render_key(word, lst_title, lst_doc, data_ipa)
+            lst_entry = cache.get(key)
+            if lst_entry is not None:
+                yield char, key, lst_entry, False
+                continue
+
+        logger.info('%s', word)
+        lst_entry = [__generate_entry(block) for block in
+                     __get_lst_block(lst_title, lst_doc, data_ipa)]
+
+        yield char, key, lst_entry, True
+
+
+def __render_init(dictname, backend, cache_path):
+    """Initialize render worker process.
+
+    Forked worker shares prefetched data of parent process, other worker
+    prefetches its own copy instead of getting it pickled.
+
+    Args:
+        dictname (str): name of dictionary
+        backend (str): storage backend
+        cache_path (Path): path to render cache, may be None
+    """
+    global __render_state
+
+    if __render_state is None:
+        db.connect(backend)
+        _, data_block, data_ipa, inf_index = __prefetch_source(dictname)
+    else:
+        data_block, data_ipa, inf_index, _ = __render_state
+
+    cache = None
+    if cache_path is not None:
+        cache = RenderCache(cache_path, readonly=True)
+
+    __render_state = (data_block, data_ipa, inf_index, cache)
+
+    use_inflection_cache()
+
+
+def __render_range(lst_word):
+    '''Render entries of range of words in worker process.'''
+    lst_entry = list(__render_words(lst_word, *__render_state))
+    save_inflection_cache()
+
+    return lst_entry
+
+
+def __prefetch_source(dictname: str) -> tuple:
+    """Load words, prefetch their blocks, ipa and inflections.
+
+    Args:
+        dictname (str): name of dictionary
+
+    Returns:
+        tuple: (list of word, blocks, ipa table, inflection index)
+    """
+    # Inflections of words, built by collect
+    inf_index = load_index(dictname)
+    if inf_index is None:
+        logger.warning('No inflection index of %s, run collect first',
+                       dictname)
+
+    # Get list of word
+    info = db.info_get_doc(dictname, 'word')
+    lst_word = [w.strip() for w in info.get('words', [])]
+
+    # Prefetch all blocks and ipa, no query per word
+    start = time.perf_counter()
+    data_block = __prefetch_block(dictname)
+
+    data_ipa = load_ipa_table()
+    if data_ipa is None:
+        build_ipa_table()
+        data_ipa = load_ipa_table()
+
+    logger.info('prefetch %s titles in %.1fs', len(data_block),
+                time.perf_counter() - start)
+
+    return lst_word, data_block, data_ipa, inf_index
 
-        count += 1
-        logger.info('%s %s', count, word)
-        for block in __get_lst_block(dictname, word):
-            str_block = __generate_entry(block)
-            text_page += str_block
 
-    # Append last page
-    lst_page.append(text_page)
+def generate_ebook(dictname, page_size=PAGE_SIZE, workers=1,
+                   incremental=False):
+    """Generate .mobi file of dictionary.
 
-    file_opf = __generate_directory(dictname, lst_page)
+    Words are split into ranges rendered by worker processes, output is the
+    same as rendered by one process.
+
+    In incremental mode, entries of words whose source data did not change
+    are taken from render cache, and only changed page files are written.
+
+    Args:
+        dictname (str): name of dictionary
+        page_size (int, optional): size limit of page file in bytes, 0 for
+            one page per letter. Defaults to PAGE_SIZE.
+        workers (int, optional): number of render processes. Defaults to 1.
+        incremental (bool, optional): incremental mode. Defaults to False.
+    """
+    global __render_state
+
+    use_inflection_cache()
+
+    start = time.perf_counter()
+    lst_word, data_block, data_ipa, inf_index = __prefetch_source(dictname)
+    t_prefetch = time.perf_counter() - start
+
+    start = time.perf_counter()
+
+    dir_rst, info_book = __prepare_directory(dictname, incremental)
+
+    cache = None
+    cache_path = None
+    if incremental:
+        cache_path = DIR_OUT.joinpath('{0}.render.sqlite'.format(dictname))
+        cache = RenderCache(cache_path)
+
+    if workers > 1:
+        # Forked workers get prefetched data from memory of this process
+        if multiprocessing.get_start_method() == 'fork':
+            __render_state = (data_block, data_ipa, inf_index, None)
+
+        # Connection of sqlite must not be used across fork, write pending
+        # inflections and close it, workers open their own
+        use_inflection_cache(None)
+
+        pool = multiprocessing.Pool(
+            workers, initializer=__render_init,
+            initargs=(dictname, db.backend, cache_path))
+        lst_range = [lst_word[i:i + RENDER_CHUNK]
+                     for i in range(0, len(lst_word), RENDER_CHUNK)]
+        lst_rst = itertools.chain.from_iterable(
+            pool.imap(__render_range, lst_range))
+    else:
+        pool = None
+        lst_rst = __render_words(lst_word, data_block, data_ipa, inf_index,
+                                 cache)
+
+    # Pages are written in order of words whatever number of workers
+    count = 0
+    done = False
+    try:
+        with PageWriter(dir_rst, info_book, page_size, incremental) as writer:
+            for char, key, lst_entry, new in lst_rst:
+                count += new
+                if cache is not None:
+                    cache.add(key, lst_entry, new)
+
+                for entry in lst_entry:
+                    writer.write(char, entry)
+        done = True
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+            __render_state = None
+            use_inflection_cache()
+
+        # Entries of words not reached by a failed generate are kept
+        if cache is not None:
+            cache.close(prune=done)
+
+    logger.info('%s words, %s rendered, %s pages: prefetch %.1fs, '
+                'render %.1fs', len(lst_word), count, writer.count,
+                t_prefetch, time.perf_counter() - start)
+    if incremental:
+        logger.info('%s pages changed', writer.count_changed)
+
+    save_inflection_cache()
+
+    file_opf = __generate_directory(dictname, dir_rst, info_book,
+                                    writer.count)
 
     # Generate .mobi
     DOWNLOAD.mkdir(parents=True, exist_ok=True)
@@ -437,3 +1093,38 @@ def generate_ebook(dictname):
     # Copy file to download directory
     src = Path(file_opf).parent.joinpath(filename)
     shutil.copy(src, file_mobi)
+
+
+def generate_dictionary(dictname, fmt):
+    """Generate StarDict or dictd files of dictionary, no external tool.
+
+    Blocks of each word are the same as of .mobi, they are rendered to one
+    article and streamed to files of writer in one pass.
+
+    Args:
+        dictname (str): name of dictionary
+        fmt (str): format, key of WRITERS eg. stardict, dictd
+    """
+    use_inflection_cache()
+
+    start = time.perf_counter()
+    lst_word, data_block, data_ipa, inf_index = __prefetch_source(dictname)
+
+    # Files are in a directory of format, they have the same name
+    dir_rst = DOWNLOAD.joinpath('cambridge-{0}-{1}'.format(dictname, fmt))
+    if dir_rst.exists():
+        shutil.rmtree(dir_rst)
+
+    basename = 'cambridge-{0}'.format(dictname)
+    with WRITERS[fmt](dir_rst, basename, __load_info(dictname)) as writer:
+        for word in lst_word:
+            lst_title, lst_doc = __get_lst_source(word, data_block, inf_index)
+            lst_block = __get_lst_block(lst_title, lst_doc, data_ipa)
+            if lst_block:
+                article = ''.join(ARTICLE.render(b) for b in lst_block)
+                writer.write(word, lst_title, article)
+
+    save_inflection_cache()
+
+    logger.info('%s words, %s articles in %.1fs: %s', len(lst_word),
+                writer.count, time.perf_counter() - start, dir_rst)
@@ -0,0 +1,91 @@
+import gzip
+import json
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DIR = Path(__file__).parent
+DIR_INDEX = DIR.joinpath('index')
+
+
+def get_index_path(dictname):
+    '''Get path to inflection index file of dictionary.'''
+    return DIR_INDEX.joinpath('{0}.inflection.json.gz'.format(dictname))
+
+
+def write_index(filepath, dictname, lst_item):
+    """Write inflection index file.
+
+    Args:
+        filepath (Path): path to index file
+        dictname (str): dictionary name
+        lst_item (iterable): (title, list of inflections, title first)
+
+    Returns:
+        int: number of titles
+    """
+    data_lemma = {}  # title -> inflections
+    data_form = {}  # inflection -> titles
+    for title, lst_inf in lst_item:
+        data_lemma[title] = lst_inf
+        for form in lst_inf:
+            if form != title:
+                data_form.setdefault(form, []).append(title)
+
+    for lst in data_form.values():
+        lst.sort()
+
+    data = {
+        'dictname': dictname,
+        'lemmas': data_lemma,
+        'forms': data_form
+    }
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(filepath, 'wt', encoding='utf-8') as fp:
+        json.dump(data, fp, ensure_ascii=False, sort_keys=True)
+
+    logger.info('%s titles, %s forms: %s',
+                len(data_lemma), len(data_form), filepath)
+
+    return len(data_lemma)
+
+
+class InflectionIndex(object):
+    '''Inverted index of inflections, loaded from index file.'''
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+
+        with gzip.open(self.filepath, 'rt', encoding='utf-8') as fp:
+            data = json.load(fp)
+
+        self.dictname = data.get('dictname')
+        self.lemmas = data.get('lemmas', {})
+        self.forms = data.get('forms', {})
+
+    def __len__(self):
+        return len(self.lemmas)
+
+    def get_forms(self, title):
+        '''Get inflections of title, title first, None if not indexed.'''
+        return self.lemmas.get(title)
+
+    def get_lemmas(self, form):
+        '''Get titles which form is an inflection of.'''
+        return self.forms.get(form, [])
+
+    def is_inflection(self, title):
+        '''Check if title is an inflection of another title.'''
+        return title in self.forms
+
+
+def load_index(dictname):
+    '''Load inflection index of dictionary, None if not built.'''
+    filepath = get_index_path(dictname)
+    if not filepath.exists():
+        return None
+
+    return InflectionIndex(filepath)
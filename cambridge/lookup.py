@@ -0,0 +1,212 @@
+import json
+import logging
+import mmap
+import struct
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DIR = Path(__file__).parent
+DIR_INDEX = DIR.joinpath('index')
+
+# Layout of lookup file:
+#   MAGIC
+#   records: zlib json {title, blocks} of every title, sorted by title
+#   record table: RECORD of every title
+#   keys: title or inflection, sorted by utf-8 bytes
+#   key table: KEY of every key, sorted like keys
+#   refs: record index (uint32) of titles of every key, title itself first
+#   meta: json {dictname, titles, keys}
+#   FOOTER
+MAGIC = b'CAMBLKP1'
+RECORD = struct.Struct('<QI')  # record offset, record size
+KEY = struct.Struct('<QIQI')  # key offset, key size, ref offset, ref count
+REF = struct.Struct('<I')
+FOOTER = struct.Struct('<QQQQ8s')  # records, keys, meta offset, count, MAGIC
+
+
+def get_lookup_path(dictname):
+    '''Get path to lookup file of dictionary.'''
+    return DIR_INDEX.joinpath('{0}.lookup'.format(dictname))
+
+
+def write_lookup(filepath, dictname, lst_item):
+    """Write lookup file.
+
+    Args:
+        filepath (Path): path to lookup file
+        dictname (str): dictionary name
+        lst_item (iterable): (title, list of inflections, list of blocks)
+            sorted by title
+
+    Returns:
+        int: number of titles
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    lst_record = []
+    data_key = {}  # key -> record indexes
+    data_title = {}  # title -> record index
+    with open(filepath, 'wb') as fp:
+        fp.write(MAGIC)
+
+        # Records
+        for title, lst_inf, lst_block in lst_item:
+            index = len(lst_record)
+
+            data = {'title': title, 'blocks': lst_block}
+            data = zlib.compress(json.dumps(data, ensure_ascii=False,
+                                            default=str).encode('utf-8'))
+            lst_record.append((fp.tell(), len(data)))
+            fp.write(data)
+
+            for key in set([title] + list(lst_inf)):
+                data_key.setdefault(key.encode('utf-8'), []).append(index)
+            data_title[title.encode('utf-8')] = index
+
+        # Record table
+        pos_record = fp.tell()
+        for pos, size in lst_record:
+            fp.write(RECORD.pack(pos, size))
+
+        lst_key = sorted(data_key)
+
+        # Record of title itself first
+        for key, index in data_title.items():
+            lst_ref = data_key.get(key)
+            lst_ref.remove(index)
+            lst_ref.insert(0, index)
+
+        # Keys
+        lst_pos = []
+        for key in lst_key:
+            lst_pos.append(fp.tell())
+            fp.write(key)
+
+        # Key table, refs follow it
+        pos_key = fp.tell()
+        offset = pos_key + KEY.size * len(lst_key)
+        for key, pos in zip(lst_key, lst_pos):
+            lst_ref = data_key.get(key)
+            fp.write(KEY.pack(pos, len(key), offset, len(lst_ref)))
+            offset += REF.size * len(lst_ref)
+
+        # Refs
+        for key in lst_key:
+            for index in data_key.get(key):
+                fp.write(REF.pack(index))
+
+        # Meta
+        pos_meta = fp.tell()
+        meta = {
+            'dictname': dictname,
+            'titles': len(lst_record),
+            'keys': len(lst_key)
+        }
+        fp.write(json.dumps(meta).encode('utf-8'))
+
+        fp.write(FOOTER.pack(pos_record, pos_key, pos_meta, len(lst_key),
+                             MAGIC))
+
+    logger.info('%s titles, %s keys, %s bytes: %s', len(lst_record),
+                len(lst_key), filepath.stat().st_size, filepath)
+
+    return len(lst_record)
+
+
+class Lookup(object):
+    '''Memory-mapped lookup file, finds titles of word or inflection.'''
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+
+        with open(self.filepath, 'rb') as fp:
+            self.__mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__mm)
+
+        if self.__mm[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a lookup file: {0}'.format(self.filepath))
+
+        footer = self.__mm[len(self.__mm) - FOOTER.size:]
+        pos_record, pos_key, pos_meta, count, magic = FOOTER.unpack(footer)
+        if magic != MAGIC:
+            raise ValueError('Broken lookup file: {0}'.format(self.filepath))
+
+        self.__pos_record = pos_record
+        self.__pos_key = pos_key
+        self.count = count
+
+        meta = self.__mm[pos_meta:len(self.__mm) - FOOTER.size]
+        meta = json.loads(meta.decode('utf-8'))
+        self.dictname = meta.get('dictname')
+        self.count_title = meta.get('titles')
+
+    def __len__(self):
+        return self.count
+
+    def __key(self, index):
+        '''Get (key offset, key size, ref offset, ref count) of index.'''
+        return KEY.unpack_from(self.__view, self.__pos_key + KEY.size * index)
+
+    def get_key(self, index):
+        '''Get key as bytes.'''
+        pos, size, _, _ = self.__key(index)
+        return self.__mm[pos:pos + size]
+
+    def find(self, word):
+        '''Get index of key by binary search, -1 if not found.'''
+        key = word.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.get_key(low) == key:
+            return low
+
+        return -1
+
+    def get_refs(self, index):
+        '''Get record indexes of key, record of key itself first.'''
+        _, _, pos, count = self.__key(index)
+        return [REF.unpack_from(self.__view, pos + REF.size * i)[0]
+                for i in range(count)]
+
+    def get_record(self, index):
+        '''Get {title, blocks} of record index.'''
+        pos, size = RECORD.unpack_from(
+            self.__view, self.__pos_record + RECORD.size * index)
+        data = zlib.decompress(self.__mm[pos:pos + size])
+        return json.loads(data.decode('utf-8'))
+
+    def lookup(self, word):
+        """Get titles of word, exact title first then titles which word is
+        an inflection of. Lowercase word is tried if word is not found.
+
+        Args:
+            word (str): word or inflection
+
+        Returns:
+            list: list of {title, blocks}
+        """
+        index = self.find(word)
+        if index < 0 and word.lower() != word:
+            index = self.find(word.lower())
+        if index < 0:
+            return []
+
+        return [self.get_record(i) for i in self.get_refs(index)]
+
+
+def load_lookup(dictname):
+    '''Load lookup file of dictionary, None if not built.'''
+    filepath = get_lookup_path(dictname)
+    if not filepath.exists():
+        return None
+
+    return Lookup(filepath)
@@ -0,0 +1,94 @@
+import hashlib
+import logging
+
+import db
+
+logger = logging.getLogger(__name__)
+
+BATCH = 1000  # Number of pages read at once to hash html
+
+
+def get_html_hash(html):
+    '''Get sha1 hex digest of html.'''
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    return hashlib.sha1(html).hexdigest()
+
+
+def get_header(headers, name):
+    '''Get value of response header as text, None if not found.'''
+    value = headers.get(name)
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+
+    return value or None
+
+
+class Validators(object):
+    '''Validators of crawled pages to re-crawl only changed ones.
+
+    Validators are ETag, Last-Modified and hash of html of each url, loaded
+    once from html collection.
+    '''
+
+    def __init__(self, dictname):
+        self.dictname = dictname
+        self.data = {url: (etag, modified, html_hash)
+                     for url, etag, modified, html_hash
+                     in db.html_get_validators(dictname)}
+
+        # Pages crawled before hash of html was kept
+        lst_url = [url for url, value in self.data.items() if value[2] is None]
+        if lst_url:
+            self.__fill_hash(lst_url)
+
+    def __fill_hash(self, lst_url):
+        '''Hash stored html of urls once and keep hash in html collection.'''
+        for i in range(0, len(lst_url), BATCH):
+            lst_doc = []
+            for doc in db.html_get_urls(self.dictname, lst_url[i:i + BATCH]):
+                url = doc.get('url')
+                etag, modified, _ = self.data.get(url)
+                html_hash = get_html_hash(doc.get('html'))
+                self.data[url] = (etag, modified, html_hash)
+
+                lst_doc.append({'dictionary': self.dictname, 'url': url,
+                                'etag': etag, 'lastModified': modified,
+                                'htmlHash': html_hash})
+
+            db.html_set_validators(lst_doc)
+
+        logger.info('Hash html of %s pages', len(lst_url))
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_headers(self, url):
+        """Get headers of conditional request of url.
+
+        Args:
+            url (str): url of page
+
+        Returns:
+            dict: If-None-Match and If-Modified-Since of known validators
+        """
+        etag, modified, _ = self.data.get(url, (None, None, None))
+
+        headers = {}
+        if etag:
+            headers.update({'If-None-Match': etag})
+        if modified:
+            headers.update({'If-Modified-Since': modified})
+
+        return headers
+
+    def is_changed(self, url, html_hash):
+        '''Check if html of url is new or differs from crawled one.'''
+        _, _, prev = self.data.get(url, (None, None, None))
+        return prev is None or prev != html_hash
+
+    def is_stale(self, url, etag, modified):
+        '''Check if ETag or Last-Modified of url differs from crawled one.'''
+        prev_etag, prev_modified, _ = self.data.get(url, (None, None, None))
+        return (prev_etag, prev_modified) != (etag, modified)
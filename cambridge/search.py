@@ -0,0 +1,124 @@
+import bisect
+import heapq
+
+
+class SearchIndex(object):
+    '''Prefix and fuzzy search over headwords and their inflections.
+
+    Keys are casefolded and sorted, a range of keys sharing a prefix is a
+    node of an implicit trie, so no trie is kept in memory.
+    '''
+
+    def __init__(self, lst_title, inf_index=None):
+        """Build search index.
+
+        Args:
+            lst_title (list): list of title
+            inf_index (InflectionIndex, optional): inflections of titles.
+                Defaults to None.
+        """
+        set_word = set(lst_title)
+        if inf_index is not None:
+            for title in lst_title:
+                set_word.update(inf_index.get_forms(title) or [])
+
+        lst_pair = sorted((w.casefold(), w) for w in set_word)
+        self.keys = [k for k, _ in lst_pair]
+        self.words = [w for _, w in lst_pair]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __get_end(self, prefix, low, high):
+        '''Get end of range of keys starting with prefix.'''
+        if not prefix:
+            return high
+
+        last = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return bisect.bisect_left(self.keys, last, low, high)
+
+    def prefix(self, prefix, limit=10):
+        """Get words starting with prefix, in order of key.
+
+        Args:
+            prefix (str): prefix
+            limit (int, optional): max number of words. Defaults to 10.
+
+        Returns:
+            list: list of word
+        """
+        prefix = prefix.casefold()
+        low = bisect.bisect_left(self.keys, prefix)
+        high = self.__get_end(prefix, low, len(self.keys))
+
+        return self.words[low:min(high, low + limit)]
+
+    def __fuzzy(self, word, distance):
+        '''Get all (distance, key, word) within distance of word.
+
+        Trie of keys is walked depth first with one row of Levenshtein
+        matrix per node, branches whose row exceeds distance are pruned.
+        '''
+        size = len(word)
+        out = distance + 1  # Any distance out of bound
+
+        lst_rst = []
+        stack = [(0, len(self.keys), '',
+                  [min(j, out) for j in range(size + 1)])]
+        while stack:
+            low, high, prefix, row = stack.pop()
+            depth = len(prefix)
+
+            # Key equal to prefix is first of range
+            while low < high and len(self.keys[low]) == depth:
+                if row[-1] <= distance:
+                    lst_rst.append((row[-1], self.keys[low], self.words[low]))
+                low += 1
+
+            # Children of node
+            while low < high:
+                char = self.keys[low][depth]
+                child = prefix + char
+                end = self.__get_end(child, low, high)
+
+                # Only cells within distance of diagonal can be in distance
+                row_child = [min(depth + 1, out)] + [out] * size
+                first = max(1, depth + 1 - distance)
+                last = min(size, depth + 1 + distance)
+                for j in range(first, last + 1):
+                    cost = 0 if word[j - 1] == char else 1
+                    row_child[j] = min(row_child[j - 1] + 1, row[j] + 1,
+                                       row[j - 1] + cost, out)
+
+                if min(row_child[first - 1:last + 1]) <= distance:
+                    stack.append((low, end, child, row_child))
+
+                low = end
+
+        return lst_rst
+
+    def fuzzy(self, word, distance=2, limit=10):
+        """Get words within edit distance of word, nearest first.
+
+        Distance is increased one by one until there are enough words, as
+        a small distance prunes much more of trie.
+
+        Args:
+            word (str): word
+            distance (int, optional): max edit distance. Defaults to 2.
+            limit (int, optional): max number of words. Defaults to 10.
+
+        Returns:
+            list: list of (word, distance)
+        """
+        word = word.casefold()
+
+        lst_rst = []
+        for dist in range(distance + 1):
+            lst_rst = self.__fuzzy(word, dist)
+            if len(lst_rst) >= limit:
+                break
+
+        lst_rst = heapq.nsmallest(limit, lst_rst)
+
+        return [(w, d) for d, _, w in lst_rst]
@@ -0,0 +1,74 @@
+import gzip
+import itertools
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DIR = Path(__file__).parent
+DIR_SNAPSHOT = DIR.joinpath('snapshot')
+
+COLLECTIONS = ['info', 'data', 'html']
+
+LEVEL = 6  # Gzip level, higher levels are much slower for little gain
+
+
+def get_snapshot_path(dictname, collection):
+    '''Get path to snapshot file of collection of dictionary.'''
+    return DIR_SNAPSHOT.joinpath('{0}.{1}.jsonl.gz'.format(dictname,
+                                                           collection))
+
+
+def write_snapshot(filepath, lst_doc):
+    """Write documents to gzip JSON Lines file, one doc per line.
+
+    File is written to a temporary file then renamed, a broken export does
+    not replace previous snapshot.
+
+    Args:
+        filepath (Path): path to snapshot file
+        lst_doc (iterable): documents
+
+    Returns:
+        int: number of documents
+    """
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    filepath_tmp = filepath.with_name(filepath.name + '.tmp')
+
+    count = 0
+    with gzip.open(filepath_tmp, 'wt', encoding='utf-8',
+                   compresslevel=LEVEL) as fp:
+        for doc in lst_doc:
+            fp.write(json.dumps(doc, ensure_ascii=False,
+                                separators=(',', ':')))
+            fp.write('\n')
+
+            count += 1
+            if count % 100000 == 0:
+                logger.info('%s %s', count, filepath.name)
+
+    os.replace(filepath_tmp, filepath)
+
+    return count
+
+
+def read_snapshot(filepath):
+    '''Get documents of snapshot file one by one.'''
+    with gzip.open(filepath, 'rt', encoding='utf-8') as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_batches(lst_doc, size):
+    '''Get lists of at most size documents.'''
+    iterator = iter(lst_doc)
+    while True:
+        lst_batch = list(itertools.islice(iterator, size))
+        if not lst_batch:
+            break
+
+        yield lst_batch
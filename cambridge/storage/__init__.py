@@ -0,0 +1,180 @@
+import abc
+import zlib
+
+COMPRESS = 'zlib'  # Compression of html field
+
+BACKENDS = ['mongo', 'sqlite']
+
+
+class Storage(abc.ABC):
+    '''Storage of html, info and data documents.
+
+    Documents are dict like documents of Mongo collections. Each backend
+    implements all abstract methods below.
+    '''
+
+    # Html
+    @abc.abstractmethod
+    def html_get_one(self, dictname, url):
+        '''Get one doc by url.'''
+
+    @abc.abstractmethod
+    def html_get_all(self, dictname):
+        '''Get all doc of dictionary.'''
+
+    @abc.abstractmethod
+    def html_get_ids(self, dictname):
+        '''Get sorted _id of all doc of dictionary.'''
+
+    @abc.abstractmethod
+    def html_get_range(self, dictname, first, last):
+        '''Get doc with _id in range [first, last].'''
+
+    @abc.abstractmethod
+    def html_get_urls(self, dictname, lst_url):
+        '''Get doc of list of url.'''
+
+    @abc.abstractmethod
+    def html_get_raw(self, dictname):
+        '''Get _id and html of not compressed doc.'''
+
+    @abc.abstractmethod
+    def html_set_compress(self, lst_doc):
+        '''Store list of (_id, compressed html).'''
+
+    @abc.abstractmethod
+    def html_get_size(self):
+        '''Get (data size, storage size) in bytes.'''
+
+    @abc.abstractmethod
+    def html_upsert(self, lst_doc):
+        '''Insert or replace list of doc keyed by (dictionary, url).'''
+
+    @abc.abstractmethod
+    def html_get_validators(self, dictname):
+        '''Get (url, etag, lastModified, htmlHash) of all doc.'''
+
+    @abc.abstractmethod
+    def html_set_validators(self, lst_doc):
+        '''Set etag, lastModified and htmlHash of list of doc keyed by
+        (dictionary, url), html is not written.'''
+
+    @abc.abstractmethod
+    def html_get_changed(self, dictname):
+        '''Get all doc marked changed by crawl.'''
+
+    @abc.abstractmethod
+    def html_set_unchanged(self, dictname, lst_url):
+        '''Remove changed mark of doc of list of url.'''
+
+    # Info
+    @abc.abstractmethod
+    def info_find(self, dictname):
+        '''Get all info doc of dictionary.'''
+
+    @abc.abstractmethod
+    def info_get_doc(self, dictname, document):
+        '''Get one info doc, None if not found.'''
+
+    @abc.abstractmethod
+    def info_set_doc(self, doc):
+        '''Insert or replace info doc keyed by (dictionary, document).'''
+
+    # Data
+    @abc.abstractmethod
+    def data_find(self, dictname=None, titles=None, fields=None):
+        """Get data doc filtered by dictionary and list of title.
+
+        Args:
+            dictname (str, optional): dictionary name. Defaults to None.
+            titles (list, optional): list of title. Defaults to None.
+            fields (list, optional): only get these fields. Defaults to None.
+
+        Returns:
+            iterable: data doc
+        """
+
+    @abc.abstractmethod
+    def data_write(self, lst_url, lst_block):
+        """Delete data of urls then upsert blocks keyed by
+        (dictionary, cid, title).
+
+        Args:
+            lst_url (list): list of (dictionary, url) to delete
+            lst_block (list): list of data doc
+
+        Returns:
+            int: number of round trips
+        """
+
+    @abc.abstractmethod
+    def export_find(self, collection, dictname):
+        """Get all doc of collection of dictionary without _id, streamed
+        in batches. Html is decompressed.
+
+        Args:
+            collection (str): html, info or data
+            dictname (str): dictionary name
+
+        Returns:
+            iterable: doc
+        """
+
+    @abc.abstractmethod
+    def explain(self, dictname, title):
+        """Get query plan of hot queries.
+
+        Args:
+            dictname (str): dictionary name
+            title (str): title to query
+
+        Returns:
+            list: list of (query name, plan, True if collection scan)
+        """
+
+    @abc.abstractmethod
+    def drop(self):
+        '''Delete all documents.'''
+
+    def close(self):
+        '''Close connection.'''
+        pass
+
+
+def html_compress(html):
+    '''Compress html to store in html collection.'''
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+
+    return zlib.compress(html, 9)
+
+
+def html_decompress(doc):
+    '''Decompress html of doc from html collection.'''
+    if doc is not None and doc.get('compress') == COMPRESS:
+        doc['html'] = zlib.decompress(doc.get('html'))
+        del doc['compress']
+
+    return doc
+
+
+def create_storage(backend, **kwargs):
+    """Create storage of backend.
+
+    Args:
+        backend (str): mongo or sqlite
+        kwargs: arguments of backend eg. uri, dbname for mongo and
+            filepath for sqlite
+
+    Returns:
+        Storage: storage
+    """
+    if backend == 'mongo':
+        from storage.mongo import MongoStorage
+        return MongoStorage(**kwargs)
+
+    elif backend == 'sqlite':
+        from storage.sqlite import SQLiteStorage
+        return SQLiteStorage(**kwargs)
+
+    raise ValueError('Unknown storage: {0}'.format(backend))
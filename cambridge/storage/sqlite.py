@@ -0,0 +1,341 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+
+from storage import COMPRESS, Storage, html_decompress
+
+FILEPATH = Path(__file__).parent.parent.joinpath('cambridge.sqlite')
+
+CHUNK = 500  # Number of variables per query
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS html (
+    id INTEGER PRIMARY KEY,
+    dictionary TEXT NOT NULL,
+    url TEXT NOT NULL,
+    html BLOB,
+    compress TEXT,
+    doc TEXT NOT NULL,
+    UNIQUE (dictionary, url)
+);
+
+CREATE TABLE IF NOT EXISTS info (
+    dictionary TEXT NOT NULL,
+    document TEXT NOT NULL,
+    doc TEXT NOT NULL,
+    PRIMARY KEY (dictionary, document)
+);
+
+CREATE TABLE IF NOT EXISTS data (
+    id INTEGER PRIMARY KEY,
+    dictionary TEXT NOT NULL,
+    cid TEXT,
+    title TEXT,
+    url TEXT,
+    doc TEXT NOT NULL,
+    UNIQUE (dictionary, cid, title)
+);
+
+CREATE INDEX IF NOT EXISTS html_dictionary_id ON html (dictionary, id);
+CREATE INDEX IF NOT EXISTS html_dictionary_changed
+    ON html (dictionary, json_extract(doc, '$.changed'));
+CREATE INDEX IF NOT EXISTS data_dictionary_title ON data (dictionary, title);
+CREATE INDEX IF NOT EXISTS data_dictionary_url ON data (dictionary, url);
+CREATE INDEX IF NOT EXISTS data_title ON data (title);
+'''
+
+
+class SQLiteStorage(Storage):
+    '''Storage in SQLite file, documents are stored as json.'''
+
+    def __init__(self, filepath=FILEPATH):
+        self.filepath = str(filepath)
+
+        # Writes may come from a thread of crawler pipeline
+        self.conn = sqlite3.connect(self.filepath, isolation_level=None,
+                                    check_same_thread=False)
+        self.lock = threading.Lock()
+
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def __write(self, lst_sql):
+        '''Run list of (sql, list of parameters) in one transaction.'''
+        with self.lock:
+            self.conn.execute('BEGIN')
+            try:
+                for sql, lst_param in lst_sql:
+                    self.conn.executemany(sql, lst_param)
+                self.conn.execute('COMMIT')
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    # Html
+    def __html_doc(self, row):
+        _id, dictname, url, html, compress, text = row
+        doc = json.loads(text)
+        doc.update({
+            '_id': _id,
+            'dictionary': dictname,
+            'url': url,
+            'html': html
+        })
+        if compress is not None:
+            doc.update({'compress': compress})
+
+        return html_decompress(doc)
+
+    def __html_select(self, where, params):
+        sql = 'SELECT id, dictionary, url, html, compress, doc FROM html ' \
+            'WHERE {0} ORDER BY id'.format(where)
+        cursor = self.conn.execute(sql, params)
+        return map(self.__html_doc, cursor)
+
+    def html_get_one(self, dictname, url):
+        lst = list(self.__html_select('dictionary = ? AND url = ?',
+                                      (dictname, url)))
+        return lst[0] if lst else None
+
+    def html_get_all(self, dictname):
+        return self.__html_select('dictionary = ?', (dictname,))
+
+    def html_get_ids(self, dictname):
+        sql = 'SELECT id FROM html WHERE dictionary = ? ORDER BY id'
+        return [row[0] for row in self.conn.execute(sql, (dictname,))]
+
+    def html_get_range(self, dictname, first, last):
+        return self.__html_select('dictionary = ? AND id BETWEEN ? AND ?',
+                                  (dictname, first, last))
+
+    def html_get_urls(self, dictname, lst_url):
+        lst_doc = []
+        for i in range(0, len(lst_url), CHUNK):
+            lst = lst_url[i:i + CHUNK]
+            where = 'dictionary = ? AND url IN ({0})'.format(
+                ','.join('?' * len(lst)))
+            lst_doc.extend(self.__html_select(where, [dictname] + lst))
+
+        return lst_doc
+
+    def html_get_raw(self, dictname):
+        sql = 'SELECT id, html FROM html ' \
+            'WHERE dictionary = ? AND compress IS NULL ORDER BY id'
+        cursor = self.conn.execute(sql, (dictname,))
+        return ({'_id': _id, 'html': html} for _id, html in cursor)
+
+    def html_set_compress(self, lst_doc):
+        sql = 'UPDATE html SET html = ?, compress = ? WHERE id = ?'
+        self.__write([(sql, [(html, COMPRESS, _id) for _id, html in lst_doc])])
+
+    def html_get_size(self):
+        size = self.conn.execute(
+            'SELECT COALESCE(SUM(LENGTH(html)), 0) FROM html').fetchone()[0]
+        page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        return size, page_count * page_size
+
+    def html_upsert(self, lst_doc):
+        sql = 'INSERT INTO html (dictionary, url, html, compress, doc) ' \
+            'VALUES (?, ?, ?, ?, ?) ' \
+            'ON CONFLICT (dictionary, url) DO UPDATE SET ' \
+            'html = excluded.html, compress = excluded.compress, ' \
+            'doc = excluded.doc'
+
+        lst_param = []
+        for doc in lst_doc:
+            other = {k: v for k, v in doc.items()
+                     if k not in ('_id', 'dictionary', 'url', 'html',
+                                  'compress')}
+            lst_param.append((doc.get('dictionary'), doc.get('url'),
+                              doc.get('html'), doc.get('compress'),
+                              json.dumps(other)))
+
+        self.__write([(sql, lst_param)])
+
+    def html_get_validators(self, dictname):
+        sql = "SELECT url, json_extract(doc, '$.etag'), " \
+            "json_extract(doc, '$.lastModified'), " \
+            "json_extract(doc, '$.htmlHash') FROM html WHERE dictionary = ?"
+        return self.conn.execute(sql, (dictname,))
+
+    def html_set_validators(self, lst_doc):
+        sql = "UPDATE html SET doc = json_set(doc, '$.etag', ?, " \
+            "'$.lastModified', ?, '$.htmlHash', ?) " \
+            'WHERE dictionary = ? AND url = ?'
+        self.__write([(sql, [(doc.get('etag'), doc.get('lastModified'),
+                              doc.get('htmlHash'), doc.get('dictionary'),
+                              doc.get('url')) for doc in lst_doc])])
+
+    def html_get_changed(self, dictname):
+        return self.__html_select(
+            "dictionary = ? AND json_extract(doc, '$.changed') = 1",
+            (dictname,))
+
+    def html_set_unchanged(self, dictname, lst_url):
+        lst_url = list(lst_url)
+        lst_sql = []
+        for i in range(0, len(lst_url), CHUNK):
+            lst = lst_url[i:i + CHUNK]
+            sql = "UPDATE html SET doc = json_remove(doc, '$.changed') " \
+                'WHERE dictionary = ? AND url IN ({0})'.format(
+                    ','.join('?' * len(lst)))
+            lst_sql.append((sql, [[dictname] + lst]))
+
+        if lst_sql:
+            self.__write(lst_sql)
+
+    # Info
+    def info_find(self, dictname):
+        sql = 'SELECT doc FROM info WHERE dictionary = ? ORDER BY document'
+        cursor = self.conn.execute(sql, (dictname,))
+        return (json.loads(row[0]) for row in cursor)
+
+    def info_get_doc(self, dictname, document):
+        sql = 'SELECT doc FROM info WHERE dictionary = ? AND document = ?'
+        row = self.conn.execute(sql, (dictname, document)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def info_set_doc(self, doc):
+        doc = {k: v for k, v in doc.items() if k != '_id'}
+        sql = 'INSERT OR REPLACE INTO info (dictionary, document, doc) ' \
+            'VALUES (?, ?, ?)'
+        param = (doc.get('dictionary'), doc.get('document'), json.dumps(doc))
+        self.__write([(sql, [param])])
+
+    # Data
+    def data_find(self, dictname=None, titles=None, fields=None):
+        lst_where = []
+        lst_param = []
+        if dictname is not None:
+            lst_where.append('dictionary = ?')
+            lst_param.append(dictname)
+
+        if titles is None:
+            lst_chunk = [None]
+        else:
+            titles = list(titles)
+            lst_chunk = [titles[i:i + CHUNK]
+                         for i in range(0, len(titles), CHUNK)]
+
+        lst_row = []
+        for chunk in lst_chunk:
+            where = list(lst_where)
+            params = list(lst_param)
+            if chunk is not None:
+                where.append('title IN ({0})'.format(','.join('?' * len(chunk))))
+                params.extend(chunk)
+
+            sql = 'SELECT id, doc FROM data'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY id'
+
+            cursor = self.conn.execute(sql, params)
+            if len(lst_chunk) == 1:
+                lst_row = cursor
+            else:
+                lst_row.extend(cursor)
+
+        # Keep order of insertion like natural order of Mongo
+        if len(lst_chunk) > 1:
+            lst_row.sort(key=lambda row: row[0])
+
+        def get_doc(row):
+            doc = json.loads(row[1])
+            if fields is not None:
+                doc = {k: v for k, v in doc.items() if k in fields}
+            else:
+                doc.update({'_id': row[0]})
+            return doc
+
+        return map(get_doc, lst_row)
+
+    def data_write(self, lst_url, lst_block):
+        lst_sql = []
+        if lst_url:
+            sql = 'DELETE FROM data WHERE dictionary = ? AND url = ?'
+            lst_sql.append((sql, lst_url))
+
+        if lst_block:
+            sql = 'INSERT INTO data (dictionary, cid, title, url, doc) ' \
+                'VALUES (?, ?, ?, ?, ?) ' \
+                'ON CONFLICT (dictionary, cid, title) DO UPDATE SET ' \
+                'url = excluded.url, doc = excluded.doc'
+            lst_param = []
+            for block in lst_block:
+                block = {k: v for k, v in block.items() if k != '_id'}
+                lst_param.append((block.get('dictionary'), block.get('cid'),
+                                  block.get('title'), block.get('url'),
+                                  json.dumps(block)))
+            lst_sql.append((sql, lst_param))
+
+        if not lst_sql:
+            return 0
+
+        self.__write(lst_sql)
+        return 1
+
+    def export_find(self, collection, dictname):
+        # Cursors of queries below are read row by row
+        if collection == 'html':
+            lst_doc = self.html_get_all(dictname)
+        elif collection == 'info':
+            lst_doc = self.info_find(dictname)
+        elif collection == 'data':
+            lst_doc = self.data_find(dictname)
+        else:
+            raise ValueError('Unknown collection: {0}'.format(collection))
+
+        return ({k: v for k, v in doc.items() if k != '_id'}
+                for doc in lst_doc)
+
+    def explain(self, dictname, title):
+        lst_sql = [
+            ('html_get_one', 'SELECT doc FROM html '
+             'WHERE dictionary = ? AND url = ?', (dictname, title)),
+            ('html_get_ids', 'SELECT id FROM html '
+             'WHERE dictionary = ? ORDER BY id', (dictname,)),
+            ('html_get_range', 'SELECT doc FROM html '
+             'WHERE dictionary = ? AND id BETWEEN ? AND ? ORDER BY id',
+             (dictname, 0, 0)),
+            ('html_get_changed', 'SELECT doc FROM html '
+             "WHERE dictionary = ? AND json_extract(doc, '$.changed') = 1 "
+             'ORDER BY id', (dictname,)),
+            ('info_get_doc', 'SELECT doc FROM info '
+             'WHERE dictionary = ? AND document = ?', (dictname, 'word')),
+            ('data_find_titles', 'SELECT id, doc FROM data '
+             'WHERE dictionary = ? AND title IN (?) ORDER BY id',
+             (dictname, title)),
+            ('data_find_title', 'SELECT id, doc FROM data '
+             'WHERE title IN (?) ORDER BY id', (title,)),
+            ('data_find_fields', 'SELECT id, doc FROM data '
+             'WHERE dictionary = ? ORDER BY id', (dictname,)),
+            ('data_write_block', 'SELECT id FROM data '
+             'WHERE dictionary = ? AND cid = ? AND title = ?',
+             (dictname, '', title)),
+            ('data_write_url', 'DELETE FROM data '
+             'WHERE dictionary = ? AND url = ?', (dictname, title))
+        ]
+
+        lst_rst = []
+        for name, sql, params in lst_sql:
+            cursor = self.conn.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            lst_detail = [row[-1] for row in cursor]
+
+            # Full scan of table, not of an index
+            scan = any(d.startswith('SCAN') and 'INDEX' not in d
+                       for d in lst_detail)
+            lst_rst.append((name, ' > '.join(lst_detail), scan))
+
+        return lst_rst
+
+    def drop(self):
+        self.__write([('DELETE FROM html', [()]),
+                      ('DELETE FROM info', [()]),
+                      ('DELETE FROM data', [()])])
+
+    def close(self):
+        self.conn.close()
@@ -1,18 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import logging
 import shutil
-from collections import namedtuple
 from pathlib import Path
 
 import lxml.html
 import yaml
+from lxml.cssselect import CSSSelector
 
 logger = logging.getLogger(__name__)
 
 DIR = Path(__file__).parent
 LAYOUT = DIR.joinpath('word.yaml')
+UNDEFINED = CSSSelector('UNDEFINED', translator='html')
 
 
 class ErrorUndefinedWord(Exception):
@@ -43,16 +45,160 @@ class ErrorMultipleSingleBlock(Exception):
         super().__init__(self.message)
 
 
+class Layout(object):
+    '''Layout of word with precompiled css selectors.'''
+
+    def __init__(self, filepath):
+        with open(filepath) as stream:
+            data = yaml.safe_load(stream)
+
+        self.data = data
+        self.entry = data['entry']
+        self.size = data['size']
+        self.cats = data['cssAll']
+
+        # Selector of each category is updated from base css selectors
+        self.css = {}
+        for cat in self.cats:
+            css = dict(data['css'])
+            css.update(data[cat])
+            self.css[cat] = {k: self.__compile(v) for k, v in css.items()}
+
+        self.dictionary = self.__compile(data['css']['dictionary'])
+        self.ignore = [self.__compile(s) for s in data['ignore']]
+        self.undefined = [self.__compile(s) for s in data['undefined']]
+        self.strip = [self.__compile(s) for s in data.get('strip', [])]
+
+        self.__fingerprints = {}
+
+    def fingerprint(self, cats):
+        """Get fingerprint of layout sections used by categories.
+
+        Entry selectors of all categories are included since they decide
+        which categories a page has.
+
+        Args:
+            cats (list): categories of word
+
+        Returns:
+            str: sha1 hex digest
+        """
+        key = tuple(cats)
+        value = self.__fingerprints.get(key)
+        if value is None:
+            data = self.data
+            sections = {
+                'entry': data['entry'],
+                'size': data['size'],
+                'cssAll': data['cssAll'],
+                'cats': {c: data[c]['entry'] for c in data['cssAll']},
+                'css': [dict(data['css'], **data[c]) for c in cats],
+                'undefined': data['undefined'],
+                'ignore': data['ignore']
+            }
+            text = json.dumps(sections, sort_keys=True)
+            value = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            self.__fingerprints[key] = value
+
+        return value
+
+    def __compile(self, selector):
+        '''Compile css selector or list of css selectors.'''
+        if isinstance(selector, list):
+            return [CSSSelector(s, translator='html') for s in selector]
+
+        return CSSSelector(selector, translator='html')
+
+
+__layouts = {}
+
+
+def get_layout(filepath=LAYOUT):
+    """Get compiled layout, loaded once per process.
+
+    Args:
+        filepath (Path, optional): Path to layout file. Defaults to LAYOUT.
+
+    Returns:
+        Layout: compiled layout
+    """
+    filepath = Path(filepath).resolve()
+    key = (str(filepath), filepath.stat().st_mtime)
+
+    layout = __layouts.get(key)
+    if layout is None:
+        layout = Layout(filepath)
+        __layouts.clear()
+        __layouts[key] = layout
+
+    return layout
+
+
+def strip_tree(tree, layout=LAYOUT):
+    """Strip blocks which never hold data, tail text of block is kept.
+
+    Unlike removal of ignored blocks by check_remain, tail text of stripped
+    block stays and is checked as remain text. Stripped style and noscript
+    are not ignored, their text is no more remain text.
+
+    Args:
+        tree: lxml.html element
+        layout (Path, optional): Path to layout file. Defaults to LAYOUT.
+
+    Returns:
+        lxml.html element: tree
+    """
+    for selector in get_layout(layout).strip:
+        for block in selector(tree):
+            block.drop_tree()
+
+    return tree
+
+
+def get_outermost(tree, lst_blk):
+    """Get blocks which are not nested in other blocks.
+
+    Each block only walks up its ancestors to tree and looks them up in a
+    set of blocks, instead of searching subtree of every other block.
+
+    Args:
+        tree: lxml.html element which blocks are selected from
+        lst_blk (list): list of blocks
+
+    Returns:
+        list: outermost blocks, same order as lst_blk
+    """
+    set_blk = set(lst_blk)
+
+    def is_valid(block):
+        if block is tree:
+            return False
+
+        for parent in block.iterancestors():
+            if parent in set_blk:
+                return False
+            elif parent is tree:
+                break
+
+        return True
+
+    lst_valid = [b for b in lst_blk if is_valid(b)]
+
+    return lst_valid
+
+
+def has_alpha(text):
+    '''Check text has alphabet character.'''
+    return text is not None and any(c.isalpha() for c in text)
+
+
 class Word(object):
 
     def __init__(self, root, layout=LAYOUT):
         self.root = root
 
-        with open(layout) as stream:
-            data = yaml.safe_load(stream)
-            self.__layout = namedtuple("Layout", data.keys())(*data.values())
-
-        self.__css = self.__layout.css
+        self.__layout = get_layout(layout)
+        self.__css = None
         self.__cats = self.__find_cats()
 
         # Debug info
@@ -75,6 +221,10 @@ class Word(object):
             self.__rst_dir = Path(dirpath)
             self.__rst_dir.mkdir(parents=True, exist_ok=True)
 
+    def fingerprint(self):
+        '''Get categories and fingerprint of layout sections used.'''
+        return self.__cats, self.__layout.fingerprint(self.__cats)
+
     def collect(self):
         '''Collect data from etree base on structure in layout.'''
         data = []
@@ -86,8 +236,7 @@ class Word(object):
 
         else:
             for category in self.__cats:
-                self.__css = self.__layout.css
-                self.__css.update(getattr(self.__layout, category))
+                self.__css = self.__layout.css[category]
 
                 info = {'entry': self.__layout.entry}
                 rst = self.__collect(self.root, info)
@@ -110,20 +259,24 @@ class Word(object):
 
     def check_remain(self):
         '''Check remain content.'''
-        # Clean bloat element
-        self.__clean_bloat(self.root)
+        set_dict = set(self.__layout.dictionary(self.root))
+
+        set_way = set()
+        for block in set_dict:
+            set_way.update(block.iterancestors())
 
-        # Clean ignore element
-        self.__clean_ignore()
+        set_ignore = set()
+        for selector in self.__layout.ignore:
+            set_ignore.update(selector(self.root))
 
-        # Clean empty element
-        self.__clean_empty_element()
+        # Clean bloat, ignore and empty element
+        marks = (set_dict, set_way, set_ignore)
+        _, remain = self.__clean(self.root, True, marks)
 
         if self.__is_write is True:
             self.__write_html(self.root, '_clean')
 
-        text = self.root.text_content()
-        if any(c.isalpha() for c in text):
+        if remain:
             raise ErrorRemainText
 
     def __collect(self, tree, structure):
@@ -163,34 +316,20 @@ class Word(object):
 
     def __find_cats(self):
         '''Update css selector information.'''
-        lst = [cat for cat in self.__layout.cssAll
-               if self.root.cssselect(getattr(self.__layout, cat)['entry'])]
+        lst = [cat for cat in self.__layout.cats
+               if self.__layout.css[cat]['entry'](self.root)]
 
         return lst
 
     def __find_block(self, tree, keyword):
         '''Find block of key from tree.'''
-        def is_valid(block, lst):
-            valid = True
-            if block is tree:
-                valid = False
-            else:
-                for blk in lst:
-                    if block is blk:
-                        continue
-                    elif block in blk.iter():
-                        valid = False
-                        break
-
-            return valid
-
-        slt = self.__css.get(keyword, 'UNDEFINED')
+        slt = self.__css.get(keyword, UNDEFINED)
         lst_slt = slt if isinstance(slt, list) else [slt]
 
         lst_blk = []
-        [lst_blk.extend(tree.cssselect(s)) for s in lst_slt]
+        [lst_blk.extend(s(tree)) for s in lst_slt]
 
-        lst_valid = [b for b in lst_blk if is_valid(b, lst_blk)]
+        lst_valid = get_outermost(tree, lst_blk)
 
         size = self.__layout.size.get(keyword, '0+')
         if size[0] == '1' and len(lst_valid) == 0:
@@ -212,7 +351,7 @@ class Word(object):
         undefined = False
         if len(self.__cats) == 0:
             for selector in self.__layout.undefined:
-                if self.root.cssselect(selector):
+                if selector(self.root):
                     undefined = True
                     break
 
@@ -235,36 +374,57 @@ class Word(object):
             with open(filepath, 'wb') as fp:
                 fp.write(html)
 
-    def __clean_ignore(self):
-        '''Remove block from ignore list.'''
-        for selector in self.__layout.ignore:
-            for block in self.root.cssselect(selector):
-                block.getparent().remove(block)
-
-    def __clean_bloat(self, root):
-        '''Clean bloat block.'''
-        selector = self.__layout.css.get('dictionary')
-        for child in root:
-            if child in root.cssselect(selector):
+    def __clean(self, element, is_bloat, marks):
+        """Clean bloat, ignore and empty children of element bottom-up.
+
+        Bloat children are the ones not on the way to a dictionary block.
+        A child is empty if its whole text, tails of its descendants
+        included, has no alphabet before empty children are removed. An
+        empty child is removed together with its tail.
+
+        Args:
+            element: lxml.html element
+            is_bloat (bool): children not on the way to dictionary are bloat
+            marks (tuple): sets of (dictionary, way to dictionary, ignore)
+
+        Returns:
+            tuple: (alphabet in text of element before empty children are
+                removed, alphabet in text of element which remains)
+        """
+        set_dict, set_way, set_ignore = marks
+
+        alpha = remain = has_alpha(element.text)
+        for child in list(element):
+            if child in set_ignore:
+                element.remove(child)
                 continue
-            elif child.cssselect(selector):
-                self.__clean_bloat(child)
+
+            # Comment: its text is not content of parent but its tail is
+            elif not isinstance(child.tag, str):
+                if is_bloat:
+                    element.remove(child)
+                    continue
+
+                keep = has_alpha(child.text)
+                alpha_child = remain_child = False
+
+            elif is_bloat and child not in set_dict \
+                    and child not in set_way:
+                element.remove(child)
+                continue
+
             else:
-                root.remove(child)
-
-    def __clean_empty_element(self):
-        '''Clean empty element.'''
-        def is_empty(element):
-            text = element.text_content()
-            empty = not any(c.isalpha() for c in text)
-            return empty
-
-        clean = True
-        while clean:
-            clean = False
-            for element in self.root.iter():
-                if is_empty(element) and element.getparent() is not None:
-                    try:
-                        element.getparent().remove(element)
-                    except:
-                        pass
+                is_bloat_child = is_bloat and child not in set_dict
+                alpha_child, remain_child = self.__clean(child, is_bloat_child,
+                                                         marks)
+                keep = alpha_child
+
+            alpha_tail = has_alpha(child.tail)
+            alpha = alpha or alpha_child or alpha_tail
+
+            if keep:
+                remain = remain or remain_child or alpha_tail
+            else:
+                element.remove(child)
+
+        return alpha, remain
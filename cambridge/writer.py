@@ -0,0 +1,337 @@
+import abc
+import html
+import logging
+import re
+import shutil
+import struct
+import zlib
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Dictzip is gzip of chunks compressed one by one, chunk table is in extra
+# field of header so any chunk can be decompressed alone.
+DICTZIP_CHUNK = 58315  # Uncompressed chunk size, compressed one fits uint16
+DICTZIP_MAX = (0xFFFF - 10) // 2  # Number of chunks fitting extra field
+
+DICTD_B64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+STARDICT_IFO = '''StarDict's dict ifo file
+version=3.0.0
+bookname={bookname}
+wordcount={wordcount}
+synwordcount={synwordcount}
+idxfilesize={idxfilesize}
+author={author}
+website={website}
+description={description}
+date={date}
+sametypesequence=h
+'''
+
+
+class DictZip(object):
+    '''Stream data to dictzip file.
+
+    Compressed chunks go to a temporary file, header with chunk table is
+    only known at the end and written before them on close.
+    '''
+
+    def __init__(self, filepath, level=9):
+        self.filepath = Path(filepath)
+        self.filepath_tmp = self.filepath.with_name(
+            self.filepath.name + '.tmp')
+
+        self.fp = open(self.filepath_tmp, 'wb')
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                           -zlib.MAX_WBITS)
+
+        self.buffer = bytearray()
+        self.lst_size = []  # Compressed size of chunks
+        self.size = 0  # Uncompressed size
+        self.crc = 0
+
+    def __write_chunk(self, chunk, mode):
+        data = self.compressor.compress(bytes(chunk))
+        data += self.compressor.flush(mode)
+        if len(data) > 0xFFFF:
+            raise ValueError('Chunk too large: {0}'.format(len(data)))
+
+        self.lst_size.append(len(data))
+        self.fp.write(data)
+
+    def write(self, data: bytes) -> int:
+        '''Write data, return its offset in uncompressed data.'''
+        offset = self.size
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+        # Last chunk is kept to be finished on close
+        self.buffer += data
+        while len(self.buffer) > DICTZIP_CHUNK:
+            self.__write_chunk(self.buffer[:DICTZIP_CHUNK], zlib.Z_FULL_FLUSH)
+            del self.buffer[:DICTZIP_CHUNK]
+
+        return offset
+
+    def close(self):
+        '''Finish last chunk, write header, chunks and trailer to file.'''
+        try:
+            self.__close()
+        finally:
+            self.abort()
+
+    def abort(self):
+        '''Close and remove temporary file.'''
+        self.fp.close()
+        self.filepath_tmp.unlink(missing_ok=True)
+
+    def __close(self):
+        self.__write_chunk(self.buffer, zlib.Z_FINISH)
+        self.fp.close()
+
+        count = len(self.lst_size)
+        if count > DICTZIP_MAX:
+            raise ValueError('Too many chunks: {0}'.format(count))
+
+        extra = struct.pack('<2sHHHH', b'RA', 6 + 2 * count, 1,
+                            DICTZIP_CHUNK, count)
+        extra += struct.pack('<{0}H'.format(count), *self.lst_size)
+
+        # No file name, mtime 0 so same data gives same file
+        header = struct.pack('<BBBBIBBH', 0x1F, 0x8B, 8, 4, 0, 2, 3,
+                             len(extra))
+
+        with open(self.filepath, 'wb') as fp:
+            fp.write(header)
+            fp.write(extra)
+            with open(self.filepath_tmp, 'rb') as fp_tmp:
+                shutil.copyfileobj(fp_tmp, fp)
+            fp.write(struct.pack('<II', self.crc & 0xFFFFFFFF,
+                                 self.size & 0xFFFFFFFF))
+
+
+def html_to_text(text: str) -> str:
+    '''Convert html of article to plain text, a line per line break.'''
+    text = re.sub(r'<br\s*/?>', '\n', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = html.unescape(text).replace('\xa0', ' ')
+
+    lst_line = [' '.join(line.split()) for line in text.split('\n')]
+
+    return '\n'.join(line for line in lst_line if line)
+
+
+class BookWriter(abc.ABC):
+    '''Base of writers streaming articles of words to dictionary files.
+
+    Words may come in any order, articles are appended to data file as
+    they come and index is sorted on close.
+    '''
+
+    def __init__(self, dir_rst, basename, info):
+        """Create writer.
+
+        Args:
+            dir_rst (Path): path to output directory
+            basename (str): name of files without extension
+            info (dict): config data of dictionary
+        """
+        self.dir_rst = Path(dir_rst)
+        self.basename = basename
+        self.info = info
+
+        self.dir_rst.mkdir(parents=True, exist_ok=True)
+
+        self.count = 0  # Number of articles
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is not None:
+            self.abort()
+            return
+
+        try:
+            self.close()
+        except BaseException:
+            self.abort()
+            raise
+
+    def get_path(self, extension):
+        return self.dir_rst.joinpath(self.basename + extension)
+
+    @abc.abstractmethod
+    def write(self, word: str, lst_form: list, article: str) -> None:
+        """Write article of word.
+
+        Args:
+            word (str): headword
+            lst_form (list): inflections of word, may include word
+            article (str): html of article
+        """
+
+    @abc.abstractmethod
+    def close(self):
+        '''Finish files of book.'''
+
+    def abort(self):
+        '''Close files and remove output directory of broken book.'''
+        shutil.rmtree(self.dir_rst, ignore_errors=True)
+
+
+class StarDictWriter(BookWriter):
+    '''Write StarDict .ifo, .idx, .syn and .dict.dz files, html articles.
+
+    Inflections are synonyms in .syn file.
+    '''
+
+    def __init__(self, dir_rst, basename, info):
+        super().__init__(dir_rst, basename, info)
+
+        self.dict = DictZip(self.get_path('.dict.dz'))
+        self.lst_idx = []  # (word, offset, size)
+        self.lst_syn = []  # (form, position of word in lst_idx)
+
+    @staticmethod
+    def get_key(word: bytes) -> tuple:
+        '''Get sort key of word, order of stardict_strcmp.'''
+        return word.lower(), word
+
+    def write(self, word, lst_form, article):
+        data = article.encode('utf-8')
+        offset = self.dict.write(data)
+
+        word = word.encode('utf-8')
+        index = len(self.lst_idx)
+        self.lst_idx.append((word, offset, len(data)))
+
+        for form in set(lst_form):
+            form = form.encode('utf-8')
+            if form != word:
+                self.lst_syn.append((form, index))
+
+        self.count += 1
+
+    def close(self):
+        self.dict.close()
+
+        # Index, synonyms refer to position of word in sorted index
+        lst_order = sorted(range(len(self.lst_idx)),
+                           key=lambda i: self.get_key(self.lst_idx[i][0]))
+        lst_position = [0] * len(lst_order)
+        for position, index in enumerate(lst_order):
+            lst_position[index] = position
+
+        with open(self.get_path('.idx'), 'wb') as fp:
+            for index in lst_order:
+                word, offset, size = self.lst_idx[index]
+                fp.write(word + b'\0' + struct.pack('>II', offset, size))
+            size_idx = fp.tell()
+
+        self.lst_syn.sort(key=lambda x: (self.get_key(x[0]),
+                                         lst_position[x[1]]))
+        with open(self.get_path('.syn'), 'wb') as fp:
+            for form, index in self.lst_syn:
+                fp.write(form + b'\0' + struct.pack('>I', lst_position[index]))
+
+        # Values of ifo are one line
+        data = {
+            'bookname': self.info.get('dictname'),
+            'wordcount': len(self.lst_idx),
+            'synwordcount': len(self.lst_syn),
+            'idxfilesize': size_idx,
+            'author': self.info.get('creator'),
+            'website': self.info.get('contributor'),
+            'description': self.info.get('description', ''),
+            'date': self.info.get('generateDay')
+        }
+        data = {k: ' '.join(str(v).split()) for k, v in data.items()}
+
+        with open(self.get_path('.ifo'), 'w', encoding='utf-8') as fp:
+            fp.write(STARDICT_IFO.format(**data))
+
+        logger.info('%s words, %s synonyms: %s', len(self.lst_idx),
+                    len(self.lst_syn), self.get_path('.ifo'))
+
+    def abort(self):
+        self.dict.abort()
+        super().abort()
+
+
+class DictdWriter(BookWriter):
+    '''Write dictd .index and .dict.dz files, plain text articles.
+
+    Inflections are headwords of article of word in .index file.
+    '''
+
+    def __init__(self, dir_rst, basename, info):
+        super().__init__(dir_rst, basename, info)
+
+        self.dict = DictZip(self.get_path('.dict.dz'))
+        self.lst_index = []  # (headword, offset, size)
+
+        # Database info entries, dictd shows them by name
+        description = ' '.join(str(self.info.get('description', '')).split())
+        for headword, text in [
+                ('00-database-allchars', ''),
+                ('00-database-utf8', ''),
+                ('00-database-short', self.info.get('dictname')),
+                ('00-database-url', self.info.get('contributor')),
+                ('00-database-info', description)]:
+            self.__write_text([headword], headword, text)
+
+    @staticmethod
+    def get_number(number: int) -> str:
+        '''Encode number with base64 digits of dictd.'''
+        lst_digit = []
+        while True:
+            number, digit = divmod(number, 64)
+            lst_digit.append(DICTD_B64[digit])
+            if number == 0:
+                break
+
+        return ''.join(reversed(lst_digit))
+
+    @staticmethod
+    def get_key(headword: str) -> tuple:
+        '''Get sort key of headword, case is ignored first.'''
+        return headword.lower().encode('utf-8'), headword.encode('utf-8')
+
+    def __write_text(self, lst_headword, word, text):
+        lst_line = [word] + ['   ' + line for line in text.split('\n') if line]
+        data = '\n'.join(lst_line).encode('utf-8') + b'\n'
+        offset = self.dict.write(data)
+
+        for headword in set(lst_headword):
+            # Tab and line break separate fields of index
+            headword = ' '.join(headword.split())
+            if headword:
+                self.lst_index.append((headword, offset, len(data)))
+
+    def write(self, word, lst_form, article):
+        self.__write_text([word] + list(lst_form), word, html_to_text(article))
+        self.count += 1
+
+    def close(self):
+        self.dict.close()
+
+        self.lst_index.sort(key=lambda x: (self.get_key(x[0]), x[1]))
+        with open(self.get_path('.index'), 'w', encoding='utf-8') as fp:
+            for headword, offset, size in self.lst_index:
+                fp.write('{0}\t{1}\t{2}\n'.format(
+                    headword, self.get_number(offset), self.get_number(size)))
+
+        logger.info('%s words, %s headwords: %s', self.count,
+                    len(self.lst_index), self.get_path('.index'))
+
+    def abort(self):
+        self.dict.abort()
+        super().abort()
+
+
+WRITERS = {
+    'stardict': StarDictWriter,
+    'dictd': DictdWriter
+}
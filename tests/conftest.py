@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules of cambridge import each other by name
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('cambridge')))
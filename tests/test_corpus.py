@@ -0,0 +1,33 @@
+import pytest
+
+from corpus import URL, Corpus, write_corpus
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    lst_doc = [{'url': URL.format(dictname='english', word=word),
+                'html': '<b>{0}</b>'.format(word)} for word in ['b', 'a']]
+    filepath = tmp_path / 'english.corpus'
+    write_corpus(filepath, 'english', lst_doc, [lst_doc[0].get('url')])
+
+    return Corpus(filepath)
+
+
+def test_corpus(corpus):
+    assert corpus.html_get_one('english', 'a').get('html') == b'<b>a</b>'
+    assert corpus.html_get_one('english', 'c') is None
+    assert [d.get('html') for d in corpus.html_get_all('english')] \
+        == [b'<b>a</b>', b'<b>b</b>']
+    assert corpus.html_get_ids('english') == [0, 1]
+    assert [d.get('url') for d in corpus.html_get_sample('english')] \
+        == [URL.format(dictname='english', word='b')]
+
+
+def test_corpus_other_dictionary(corpus):
+    for func, args in [(corpus.html_get_one, ['a']),
+                       (corpus.html_get_all, []),
+                       (corpus.html_get_ids, []),
+                       (corpus.html_get_range, [0, 1]),
+                       (corpus.html_get_sample, [])]:
+        with pytest.raises(ValueError):
+            func('english-vietnamese', *args)
@@ -0,0 +1,177 @@
+import hashlib
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('scrapy')
+
+import db  # noqa: E402
+from storage import create_storage  # noqa: E402
+
+DIR = Path(__file__).parent.parent.joinpath('cambridge')
+
+BROWSE = '/us/browse/english/'
+WORD = '/us/dictionary/english/{0}'
+
+# Crawl runs in its own process, reactor of twisted can not restart
+CRAWL = '''
+import sys
+sys.path.insert(0, {dir!r})
+import crawl, db
+from pathlib import Path
+from storage import create_storage
+db.backend = 'sqlite'
+db.store = create_storage('sqlite', filepath={filepath!r})
+crawl.DIR_JOB = Path({jobdir!r})
+crawl.crawl_html('english', refresh={refresh!r}, url_base={url!r})
+'''
+
+
+class Site(object):
+    '''Stand-in of dictionary site, pages of words may change.'''
+
+    def __init__(self):
+        self.pages = {}  # word -> text
+        self.etag = {}  # word -> True if conditional requests are served
+        self.salt = {}  # word -> text changing ETag but not html
+        self.log = []  # (path, If-None-Match, status)
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                site.handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def handle(self, request):
+        path = request.path
+        if path == BROWSE:
+            links = ''.join('<a href="{0}">{1}</a>'.format(WORD.format(w), w)
+                            for w in sorted(self.pages))
+            body = '<html><body>{0}</body></html>'.format(links)
+            tag = None
+        else:
+            word = path.split('/')[-1]
+            body = '<html><body><div id="page-content"><b>{0}</b></div>' \
+                '</body></html>'.format(self.pages[word])
+            text = body + self.salt.get(word, '')
+            tag = '"{0}"'.format(hashlib.md5(text.encode()).hexdigest()) \
+                if self.etag.get(word) else None
+
+        condition = request.headers.get('If-None-Match')
+        status = 304 if tag is not None and condition == tag else 200
+        self.log.append((path, condition, status))
+
+        request.send_response(status)
+        if tag is not None:
+            request.send_header('ETag', tag)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.end_headers()
+        if status == 200:
+            request.wfile.write(body.encode())
+
+    def close(self):
+        self.server.shutdown()
+
+
+@pytest.fixture
+def site():
+    site = Site()
+    yield site
+    site.close()
+
+
+def crawl(site, tmp_path, name, refresh):
+    code = CRAWL.format(dir=str(DIR), filepath=str(tmp_path / 'db.sqlite'),
+                        jobdir=str(tmp_path / name), refresh=refresh,
+                        url=site.url)
+    proc = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                          text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+
+
+def get_docs(tmp_path):
+    store = create_storage('sqlite', filepath=tmp_path / 'db.sqlite')
+    try:
+        return {d.get('url').split('/')[-1]: d
+                for d in store.html_get_all('english')}
+    finally:
+        store.close()
+
+
+def test_refresh_crawl(site, tmp_path):
+    site.pages.update({'same': 'same', 'changed': 'old', 'plain': 'plain'})
+    site.etag.update({'same': True, 'changed': True})
+
+    crawl(site, tmp_path, 'job', False)
+    data_doc = get_docs(tmp_path)
+    assert sorted(data_doc) == ['changed', 'plain', 'same']
+    assert all('htmlHash' in d and 'changed' not in d
+               for d in data_doc.values())
+
+    site.pages.update({'changed': 'new'})
+    site.log.clear()
+    crawl(site, tmp_path, 'refresh', True)
+
+    data_status = {p.split('/')[-1]: (c is not None, s)
+                   for p, c, s in site.log if p != BROWSE}
+    assert data_status == {
+        'same': (True, 304),  # Not modified
+        'changed': (True, 200),
+        'plain': (False, 200)  # Same html, no validator of server
+    }
+
+    data_new = get_docs(tmp_path)
+    assert b'new' in data_new['changed'].get('html')
+    assert data_new['changed'].get('changed') is True
+    assert data_new['changed'].get('etag') != data_doc['changed'].get('etag')
+
+    # Pages not changed are not written
+    for word in ['same', 'plain']:
+        assert data_new[word] == data_doc[word]
+
+
+def test_refresh_legacy_and_new_etag(site, tmp_path):
+    site.pages.update({'legacy': 'legacy', 'retag': 'retag'})
+    site.etag.update({'retag': True})
+
+    crawl(site, tmp_path, 'job', False)
+
+    # Pages crawled before hash of html was kept
+    store = create_storage('sqlite', filepath=tmp_path / 'db.sqlite')
+    store.conn.execute("UPDATE html SET doc = json_remove(doc, '$.htmlHash') "
+                       "WHERE url LIKE '%legacy'")
+    store.close()
+    data_doc = get_docs(tmp_path)
+    assert 'htmlHash' not in data_doc['legacy']
+
+    site.salt.update({'retag': 'new'})
+    crawl(site, tmp_path, 'refresh', True)
+
+    data_new = get_docs(tmp_path)
+    assert 'changed' not in data_new['legacy']
+    assert data_new['legacy'].get('htmlHash') \
+        == hashlib.sha1(data_doc['legacy'].get('html')).hexdigest()
+    assert data_new['legacy'].get('html') == data_doc['legacy'].get('html')
+
+    # Same html with new ETag, only validators are updated
+    assert 'changed' not in data_new['retag']
+    assert data_new['retag'].get('etag') != data_doc['retag'].get('etag')
+    assert data_new['retag'].get('html') == data_doc['retag'].get('html')
+
+    # Next refresh gets not modified
+    site.log.clear()
+    crawl(site, tmp_path, 'again', True)
+    assert (WORD.format('retag'), data_new['retag'].get('etag'), 304) \
+        in site.log
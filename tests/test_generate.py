@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import generate
+from generate import PageWriter
+
+DIR = Path(__file__).parent.parent.joinpath('cambridge')
+
+INFO = {'dictname': 'test'}
+
+
+def write_book(dir_rst, lst_entry, incremental=True, error=None):
+    with PageWriter(dir_rst, INFO, size=1, incremental=incremental) as writer:
+        for key, entry in lst_entry:
+            if entry == error:
+                raise KeyError(entry)
+            writer.write(key, entry)
+
+    return writer
+
+
+def read_book(dir_rst):
+    return {p.name: p.read_bytes() for p in dir_rst.iterdir()}
+
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_page_writer_empty(tmp_path, incremental):
+    dir_rst = tmp_path / 'book'
+    dir_rst.mkdir()
+    writer = write_book(dir_rst, [], incremental)
+
+    assert writer.count == 1
+    assert list(read_book(dir_rst)) == ['0.html']
+    assert b'</html>' in dir_rst.joinpath('0.html').read_bytes()
+    assert list(tmp_path.iterdir()) == [dir_rst]
+
+
+def test_page_writer_incremental(tmp_path):
+    dir_rst = tmp_path / 'book'
+    dir_rst.mkdir()
+    write_book(dir_rst, [('a', 'a1'), ('a', 'a2'), ('b', 'b1'), ('c', 'c1')])
+    data_old = read_book(dir_rst)
+    assert sorted(data_old) == ['0.html', '1.html', '2.html', '3.html']
+
+    # Failed run with new data leaves book as it was
+    lst_entry = [('a', 'a1'), ('a', 'new'), ('b', 'b1')]
+    with pytest.raises(KeyError):
+        write_book(dir_rst, lst_entry + [('c', 'error')], error='error')
+    assert read_book(dir_rst) == data_old
+    assert list(tmp_path.iterdir()) == [dir_rst]
+
+    writer = write_book(dir_rst, lst_entry)
+    data_new = read_book(dir_rst)
+    assert writer.count_changed == 1
+    assert sorted(data_new) == ['0.html', '1.html', '2.html']
+    assert b'new' in data_new['1.html']
+    assert data_new['0.html'] == data_old['0.html']
+    assert data_new['2.html'] == data_old['2.html']
+    assert list(tmp_path.iterdir()) == [dir_rst]
+
+
+def get_render_version(monkeypatch):
+    monkeypatch.setattr(generate, '__render_version', None)
+    return getattr(generate, '__get_render_version')()
+
+
+def test_render_version(monkeypatch):
+    version = get_render_version(monkeypatch)
+
+    # Same in other processes whatever their hash seed
+    code = 'import sys; sys.path.insert(0, {0!r}); import generate; ' \
+        'print(getattr(generate, "__get_render_version")())'.format(str(DIR))
+    for seed in ['1', '2']:
+        proc = subprocess.run([sys.executable, '-c', code], text=True,
+                              capture_output=True, check=True,
+                              env=dict(os.environ, PYTHONHASHSEED=seed))
+        assert proc.stdout.split()[-1] == version
+
+    monkeypatch.setitem(generate.PRIORITY, 'cbed', 0)
+    assert get_render_version(monkeypatch) != version
+    monkeypatch.undo()
+
+    # Code of block processing is part of version
+    monkeypatch.setattr(generate, '__get_be_removed_index', lambda x: [])
+    assert get_render_version(monkeypatch) != version
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_inflection_cache_fork(tmp_path, monkeypatch):
+    pytest.importorskip('lemminflect')
+
+    filepath = tmp_path / 'inflection.sqlite'
+    generate.use_inflection_cache(filepath)
+    monkeypatch.setitem(getattr(generate, '__inflection_pending'), 'word',
+                        ('word',))
+
+    pid = os.fork()
+    if pid == 0:
+        # Inherited connection and pending inflections are not used
+        conn = generate.inflection_cache
+        generate.use_inflection_cache(filepath)
+        ok = generate.inflection_cache is not conn \
+            and not getattr(generate, '__inflection_pending')
+        generate.use_inflection_cache(None)
+        os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    row = generate.inflection_cache.execute(
+        'SELECT COUNT(*) FROM inflection').fetchone()
+    assert row[0] == 0
+
+    generate.use_inflection_cache(None)
+
+
+def save_words(args):
+    filepath, index = args
+    generate.use_inflection_cache(filepath)
+    for i in range(20):
+        getattr(generate, '__inflection_pending').update({
+            'w{0}-{1}-{2}'.format(index, i, j): ('w',) for j in range(200)})
+        generate.save_inflection_cache()
+    generate.use_inflection_cache(None)
+
+    return index
+
+
+def test_inflection_cache_workers(tmp_path):
+    pytest.importorskip('lemminflect')
+
+    filepath = tmp_path / 'inflection.sqlite'
+    generate.use_inflection_cache(filepath)
+    mode = generate.inflection_cache.execute(
+        'PRAGMA journal_mode').fetchone()[0]
+    assert mode == 'wal'
+
+    with multiprocessing.Pool(4) as pool:
+        pool.map(save_words, [(filepath, i) for i in range(8)])
+
+    row = generate.inflection_cache.execute(
+        'SELECT COUNT(*) FROM inflection').fetchone()
+    assert row[0] == 8 * 20 * 200
+
+    generate.use_inflection_cache(None)
@@ -0,0 +1,57 @@
+import pytest
+
+from lookup import Lookup, write_lookup
+
+LST_ITEM = [
+    ('bear', ['bears', 'bore', 'born'], [{'cid': 'bear-1'}]),
+    ('bore', ['bored', 'bores'], [{'cid': 'bore-1'}, {'cid': 'bore-2'}]),
+    ('Paris', [], [{'cid': 'paris-1'}])
+]
+
+
+@pytest.fixture
+def lookup(tmp_path):
+    filepath = tmp_path / 'english.lookup'
+    assert write_lookup(filepath, 'english', sorted(LST_ITEM)) == 3
+
+    return Lookup(filepath)
+
+
+def get_titles(lst_record):
+    return [r.get('title') for r in lst_record]
+
+
+def test_lookup(lookup):
+    assert lookup.dictname == 'english'
+    assert lookup.count_title == 3
+
+    lst_record = lookup.lookup('bear')
+    assert lst_record == [{'title': 'bear', 'blocks': [{'cid': 'bear-1'}]}]
+    assert get_titles(lookup.lookup('born')) == ['bear']
+
+
+def test_lookup_own_title_first(lookup):
+    # Record of bore is after bear, it still comes first
+    lst_record = lookup.lookup('bore')
+    assert get_titles(lst_record) == ['bore', 'bear']
+    assert lst_record[0].get('blocks') == [{'cid': 'bore-1'},
+                                           {'cid': 'bore-2'}]
+
+
+def test_lookup_lowercase(lookup):
+    assert get_titles(lookup.lookup('Bears')) == ['bear']
+    assert get_titles(lookup.lookup('Paris')) == ['Paris']
+    assert lookup.lookup('paris') == []
+
+
+def test_lookup_missing(lookup):
+    assert lookup.lookup('beard') == []
+    assert lookup.lookup('') == []
+
+
+def test_lookup_bad_magic(tmp_path):
+    filepath = tmp_path / 'bad.lookup'
+    filepath.write_bytes(b'CAMBCRP1' + b'\0' * 64)
+
+    with pytest.raises(ValueError):
+        Lookup(filepath)
@@ -0,0 +1,62 @@
+import logging
+
+import pytest
+
+pytest.importorskip('scrapy')
+
+from twisted.internet import defer, threads  # noqa: E402
+
+from crawler.pipelines import BufferedPipeline  # noqa: E402
+
+
+class Spider(object):
+    dictname = 'english'
+    validators = None
+    logger = logging.getLogger('spider')
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    '''Writes started in thread, each one finishes when its deferred fires.'''
+    lst_write = []
+
+    def defer_to_thread(func, lst_doc):
+        dfd = defer.Deferred()
+        lst_write.append(([doc.get('html') for doc in lst_doc], dfd))
+        return dfd
+
+    monkeypatch.setattr(threads, 'deferToThread', defer_to_thread)
+
+    return lst_write
+
+
+def test_flush_in_order(writes):
+    spider = Spider()
+    pipeline = BufferedPipeline(1, 10, False, None)
+
+    # Same url flushed twice, second write waits for first one
+    for html in ['old', 'new']:
+        pipeline.process_item({'url': 'a', 'html': html}, spider)
+    assert [w for w, _ in writes] == [['old']]
+
+    writes[0][1].callback(None)
+    assert [w for w, _ in writes] == [['old'], ['new']]
+
+    lst_done = []
+    pipeline.close_spider(spider).addCallback(lst_done.append)
+    assert lst_done == []
+
+    writes[1][1].callback(None)
+    assert lst_done == [None]
+
+
+def test_flush_after_error(writes):
+    spider = Spider()
+    pipeline = BufferedPipeline(1, 10, False, None)
+
+    for html in ['old', 'new']:
+        pipeline.process_item({'url': 'a', 'html': html}, spider)
+
+    # Failed write is logged, next one still runs
+    writes[0][1].errback(RuntimeError('write'))
+    assert [w for w, _ in writes] == [['old'], ['new']]
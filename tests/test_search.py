@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from search import SearchIndex
+
+
+def get_distance(a, b):
+    '''Levenshtein distance by full matrix.'''
+    row = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        row_next = [i]
+        for j, char_b in enumerate(b, 1):
+            row_next.append(min(row_next[j - 1] + 1, row[j] + 1,
+                                row[j - 1] + (char != char_b)))
+        row = row_next
+
+    return row[-1]
+
+
+def get_nearest(index, word):
+    '''Get all (distance, key, word) of index, nearest first.'''
+    word = word.casefold()
+    return sorted((get_distance(word, key), key, w)
+                  for key, w in zip(index.keys, index.words))
+
+
+@pytest.fixture(scope='module')
+def words():
+    rng = random.Random(7)
+    lst_word = set()
+    while len(lst_word) < 400:
+        word = ''.join(rng.choice('abcde') for _ in range(rng.randint(1, 7)))
+        if rng.random() < 0.2:
+            word = word.capitalize()
+        lst_word.add(word)
+
+    return sorted(lst_word)
+
+
+def test_fuzzy(words):
+    index = SearchIndex(words)
+    rng = random.Random(11)
+
+    lst_query = words[::20] + [''] + [
+        ''.join(rng.choice('abcdef') for _ in range(rng.randint(1, 9)))
+        for _ in range(40)]
+    for word in lst_query:
+        lst_nearest = get_nearest(index, word)
+        for distance in range(4):
+            lst = [(w, d) for d, _, w in lst_nearest if d <= distance]
+            for limit in [1, 5, 1000]:
+                assert index.fuzzy(word, distance, limit) == lst[:limit], \
+                    (word, distance, limit)
+
+
+def test_fuzzy_case():
+    index = SearchIndex(['Apple', 'apple', 'apply'])
+
+    assert index.fuzzy('APPLE', 0) == [('Apple', 0), ('apple', 0)]
+    assert index.fuzzy('aple', 1) == [('Apple', 1), ('apple', 1)]
+
+
+def test_prefix():
+    index = SearchIndex(['apply', 'Apple', 'apple', 'Straße', 'ape', 'b'])
+
+    assert index.prefix('') == ['ape', 'Apple', 'apple', 'apply', 'b',
+                                'Straße']
+    assert index.prefix('', limit=2) == ['ape', 'Apple']
+    assert index.prefix('APPL') == ['Apple', 'apple', 'apply']
+    assert index.prefix('STRASS') == ['Straße']
+    assert index.prefix('c') == []
@@ -0,0 +1,59 @@
+import lxml.html
+import pytest
+
+from word import ErrorRemainText, Word, strip_tree
+
+
+def check_remain(html):
+    root = lxml.html.fromstring(html)
+    Word(root).check_remain()
+    return root
+
+
+def test_remain_tail_of_empty_child():
+    '''Element is kept if tail of a descendant has alphabet.'''
+    html = '<div id="page-content"><div class="pr dictionary">12' \
+        '<div class="pr dictionary"> </div>abc</div>abc</div>'
+    root = lxml.html.fromstring(html)
+
+    with pytest.raises(ErrorRemainText):
+        Word(root).check_remain()
+
+    assert lxml.html.tostring(root) == b'<div id="page-content">' \
+        b'<div class="pr dictionary">12</div>abc</div>'
+
+
+def test_no_remain():
+    html = '<div id="page-content"><div class="pr dictionary">12' \
+        '<div class="pr dictionary"> </div>3</div><div>abc</div></div>'
+
+    root = check_remain(html)
+
+    assert lxml.html.tostring(root) == b'<div id="page-content"></div>'
+
+
+def test_strip_style():
+    '''Style is not ignored, it is remain text unless stripped.'''
+    html = '<div id="page-content"><div class="pr dictionary">12' \
+        '<style>.abc {}</style></div></div>'
+
+    with pytest.raises(ErrorRemainText):
+        check_remain(html)
+
+    root = strip_tree(lxml.html.fromstring(html))
+    Word(root).check_remain()
+
+
+def test_strip_keeps_tail():
+    '''Ignored script is removed with its tail, stripped one keeps it.'''
+    html = '<div id="page-content"><div class="pr dictionary">12' \
+        '<script>x</script>abc</div></div>'
+
+    root = check_remain(html)
+    assert lxml.html.tostring(root) == b'<div id="page-content"></div>'
+
+    root = strip_tree(lxml.html.fromstring(html))
+    assert lxml.html.tostring(root) == b'<div id="page-content">' \
+        b'<div class="pr dictionary">12abc</div></div>'
+    with pytest.raises(ErrorRemainText):
+        Word(root).check_remain()
@@ -0,0 +1,160 @@
+import gzip
+import struct
+import zlib
+
+import pytest
+
+import writer
+from writer import DICTD_B64, DictZip, WRITERS
+
+INFO = {'dictname': 'test', 'creator': 'test', 'contributor': 'test'}
+
+
+ARTICLE = '<b>word</b><br>&#9726; a unit of language'
+
+
+def write_book(dir_rst, fmt):
+    with WRITERS[fmt](dir_rst, 'test', INFO) as book:
+        book.write('word', ['word', 'words'], ARTICLE)
+        book.write('Apple', ['apples'], '<b>Apple</b>')
+
+    assert book.count == 2
+    assert not list(dir_rst.glob('*.tmp'))
+
+
+def read_dictzip(filepath):
+    '''Get data of dictzip file, check each chunk decompresses alone.'''
+    raw = filepath.read_bytes()
+    data = gzip.decompress(raw)
+
+    # Header with FEXTRA flag, RA subfield holds chunk table
+    assert raw[:4] == b'\x1f\x8b\x08\x04'
+    xlen, = struct.unpack_from('<H', raw, 10)
+    sub, size, version, length, count = struct.unpack_from('<2sHHHH', raw, 12)
+    assert (sub, size, version) == (b'RA', 6 + 2 * count, 1)
+    assert xlen == 4 + size
+    lst_size = struct.unpack_from('<{0}H'.format(count), raw, 22)
+
+    pos = 12 + xlen
+    lst_chunk = []
+    for i, size in enumerate(lst_size):
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        lst_chunk.append(decompressor.decompress(raw[pos:pos + size]))
+        pos += size
+    assert pos == len(raw) - 8
+    assert b''.join(lst_chunk) == data
+    assert all(len(chunk) == length for chunk in lst_chunk[:-1])
+
+    return data
+
+
+def read_entries(data, fmt):
+    '''Get list of (key, *values) of NUL terminated entries.'''
+    entry = struct.Struct(fmt)
+    lst = []
+    pos = 0
+    while pos < len(data):
+        end = data.index(b'\0', pos)
+        lst.append((data[pos:end].decode('utf-8'),)
+                   + entry.unpack_from(data, end + 1))
+        pos = end + 1 + entry.size
+
+    return lst
+
+
+def test_stardict(tmp_path):
+    dir_rst = tmp_path / 'stardict'
+    write_book(dir_rst, 'stardict')
+
+    data = read_dictzip(dir_rst / 'test.dict.dz')
+    data_idx = (dir_rst / 'test.idx').read_bytes()
+
+    # Sorted case-insensitive
+    lst_idx = read_entries(data_idx, '>II')
+    assert [x[0] for x in lst_idx] == ['Apple', 'word']
+    lst_syn = read_entries((dir_rst / 'test.syn').read_bytes(), '>I')
+    assert lst_syn == [('apples', 0), ('words', 1)]
+
+    # Synonym resolves to article of word
+    _, offset, size = lst_idx[lst_syn[1][1]]
+    assert data[offset:offset + size].decode('utf-8') == ARTICLE
+
+    ifo = (dir_rst / 'test.ifo').read_text(encoding='utf-8').split('\n')
+    assert ifo[0] == "StarDict's dict ifo file"
+    data_ifo = dict(line.split('=', 1) for line in ifo[1:] if line)
+    assert data_ifo.get('wordcount') == '2'
+    assert data_ifo.get('synwordcount') == '2'
+    assert data_ifo.get('idxfilesize') == str(len(data_idx))
+    assert data_ifo.get('sametypesequence') == 'h'
+
+
+def test_dictd(tmp_path):
+    dir_rst = tmp_path / 'dictd'
+    write_book(dir_rst, 'dictd')
+
+    data = read_dictzip(dir_rst / 'test.dict.dz')
+
+    def get_number(text):
+        number = 0
+        for char in text:
+            number = number * 64 + DICTD_B64.index(char)
+        return number
+
+    data_index = {}
+    for line in (dir_rst / 'test.index').read_text('utf-8').splitlines():
+        headword, offset, size = line.split('\t')
+        offset, size = get_number(offset), get_number(size)
+        data_index[headword] = data[offset:offset + size].decode('utf-8')
+
+    assert data_index['words'] == data_index['word'] \
+        == 'word\n   word\n   \u25fe a unit of language\n'
+    assert data_index['apples'] == 'Apple\n   Apple\n'
+    assert data_index['00-database-short'].split('\n')[1] == '   test'
+
+
+@pytest.mark.parametrize('fmt', sorted(WRITERS))
+def test_book_error(tmp_path, fmt):
+    dir_rst = tmp_path / fmt
+    with pytest.raises(KeyError):
+        with WRITERS[fmt](dir_rst, 'test', INFO) as book:
+            book.write('word', ['words'], '<b>word</b>')
+            raise KeyError('word')
+
+    assert not dir_rst.exists()
+
+
+@pytest.mark.parametrize('fmt', sorted(WRITERS))
+def test_book_close_error(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(writer, 'DICTZIP_MAX', 0)
+
+    dir_rst = tmp_path / fmt
+    with pytest.raises(ValueError):
+        with WRITERS[fmt](dir_rst, 'test', INFO) as book:
+            book.write('word', ['words'], '<b>word</b>')
+
+    assert not dir_rst.exists()
+
+
+def test_dictzip_close_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, 'DICTZIP_MAX', 0)
+
+    dictzip = DictZip(tmp_path / 'test.dict.dz')
+    dictzip.write(b'word')
+    with pytest.raises(ValueError):
+        dictzip.close()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_dictzip_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(writer, 'DICTZIP_CHUNK', 100)
+
+    dictzip = DictZip(tmp_path / 'test.dict.dz')
+    lst = [('{0} '.format(i) * i).encode() for i in range(60)]
+    lst_offset = [dictzip.write(data) for data in lst]
+    dictzip.close()
+
+    data = read_dictzip(tmp_path / 'test.dict.dz')
+    assert len(data) > 10 * 100
+    for offset, text in zip(lst_offset, lst):
+        assert data[offset:offset + len(text)] == text